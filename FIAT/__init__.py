@@ -2,6 +2,9 @@
 evaluating arbitrary order Lagrange and many other elements.
 Simplices in one, two, and three dimensions are supported."""
 
+import os
+from itertools import chain
+
 import pkg_resources
 
 # Import finite element classes
@@ -38,6 +41,7 @@ from FIAT.hdiv_trace import HDivTrace
 from FIAT.mixed import MixedElement                       # noqa: F401
 from FIAT.restricted import RestrictedElement             # noqa: F401
 from FIAT.quadrature_element import QuadratureElement     # noqa: F401
+from FIAT.element_factory import ElementFactory
 
 # Important functionality
 from FIAT.quadrature import make_quadrature               # noqa: F401
@@ -80,3 +84,13 @@ supported_elements = {"Argyris": Argyris,
 # List of extra elements
 extra_elements = {"P0": P0,
                   "Quintic Argyris": QuinticArgyris}
+
+# Memoizing factories for the elements above, which return shared
+# elements for structurally equal arguments.  Setting FIAT_CACHE_DIR
+# also stores the elements on disk between processes.
+cached_elements = {name: ElementFactory(element_class,
+                                        cache_dir=os.environ.get("FIAT_CACHE_DIR"))
+                   for name, element_class in chain(supported_elements.items(),
+                                                    extra_elements.items(),
+                                                    [("MixedElement", MixedElement),
+                                                     ("RestrictedElement", RestrictedElement)])}
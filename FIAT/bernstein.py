@@ -9,9 +9,9 @@
 import math
 import numpy
 
-from FIAT.finite_element import FiniteElement
+from FIAT.finite_element import FiniteElement, point_array
 from FIAT.dual_set import DualSet
-from FIAT.polynomial_set import mis
+from FIAT.polynomial_set import mis, derivative_indices
 
 
 class BernsteinDualSet(DualSet):
@@ -66,7 +66,8 @@ class Bernstein(FiniteElement):
         """Return tabulated values of derivatives up to given order of
         basis functions at given points.
 
-        :arg order: The maximum order of derivative.
+        :arg order: The maximum order of derivative, or a collection
+                    of multi-indices to tabulate only those.
         :arg points: An iterable of points.
         :arg entity: Optional (dimension, entity number) pair
                      indicating which topological entity of the
@@ -79,8 +80,8 @@ class Bernstein(FiniteElement):
             entity = (ref_el.get_spatial_dimension(), 0)
 
         entity_dim, entity_id = entity
-        entity_transform = ref_el.get_entity_transform(entity_dim, entity_id)
-        cell_points = list(map(entity_transform, points))
+        C, offset = ref_el.get_entity_affine_map(entity_dim, entity_id)
+        cell_points = numpy.dot(point_array(points, C.shape[1]), C.T) + offset
 
         # Construct Cartesian to Barycentric coordinate mapping
         vs = numpy.asarray(ref_el.get_vertices())
@@ -90,22 +91,23 @@ class Bernstein(FiniteElement):
         B = numpy.hstack([cell_points,
                           numpy.ones((len(cell_points), 1))]).dot(R2B.T)
 
-        # Evaluate everything
+        # Evaluate the derivatives of the orders needed
         deg = self.degree()
         dim = ref_el.get_spatial_dimension()
+        alphas = derivative_indices(dim, order)
         raw_result = {(alpha, i): vec
                       for i, ks in enumerate(mis(dim + 1, deg))
-                      for o in range(order + 1)
+                      for o in sorted(set(map(sum, alphas)))
                       for alpha, vec in bernstein_Dx(B, ks, o, R2B).items()}
 
         # Rearrange result
         space_dim = self.space_dimension()
         dtype = numpy.array(list(raw_result.values())).dtype
         result = {alpha: numpy.zeros((space_dim, len(cell_points)), dtype=dtype)
-                  for o in range(order + 1)
-                  for alpha in mis(dim, o)}
+                  for alpha in alphas}
         for (alpha, i), vec in raw_result.items():
-            result[alpha][i, :] = vec
+            if alpha in result:
+                result[alpha][i, :] = vec
         return result
 
 
@@ -68,6 +68,12 @@ class DiscontinuousElement(CiarletElement):
         basis functions at given points."""
         return self._element.tabulate(order, points, entity)
 
+    def tabulate_all_entities(self, order, points, dim):
+        """Return tabulated values of derivatives up to given order of
+        basis functions at given points on every entity of dimension
+        dim."""
+        return self._element.tabulate_all_entities(order, points, dim)
+
     def value_shape(self):
         "Return the value shape of the finite element functions."
         return self._element.value_shape()
@@ -6,6 +6,8 @@
 
 import numpy
 
+from FIAT.functional import Functional, functional_terms, riesz_representation
+
 
 class DualSet(object):
     def __init__(self, nodes, ref_el, entity_ids):
@@ -38,9 +40,54 @@ class DualSet(object):
     def get_reference_element(self):
         return self.ref_el
 
+    def get_interpolation_points(self):
+        """Returns the union of the points at which the nodes evaluate
+        a function or its derivatives, as an array of shape
+        (num_points, sd)."""
+        return self._interpolation_operator()[0]
+
+    def get_interpolation_alphas(self):
+        """Returns the multi-indices of the derivatives of a function
+        that the nodes need, as an array of shape (num_alphas, sd).  These
+        are sorted, so the zero multi-index (plain function values) comes
+        first if it is needed."""
+        return self._interpolation_operator()[1]
+
+    def get_interpolation_matrix(self):
+        """Returns the matrix M, of shape (num_nodes, num_alphas,
+        num_points) + value_shape, mapping the derivatives of a function
+        at the interpolation points to the values of the nodes.  Given
+        an array F with F[a, p, ...] the derivative alphas[a] of the
+        function at points[p], the values of the nodes are
+        numpy.tensordot(M, F, M.ndim - 1).  Trailing axes of F, for
+        instance to interpolate several functions at once, are carried
+        through."""
+        return self._interpolation_operator()[2]
+
+    def _interpolation_operator(self):
+        try:
+            return self._interpolation
+        except AttributeError:
+            pass
+        for node in self.nodes:
+            if node.point_arrays is None or node.deriv_arrays is None:
+                raise NotImplementedError("Interpolation is not defined for %s nodes" % node.get_type_tag())
+
+        shape = tuple(self.nodes[0].target_shape)
+        sd = self.ref_el.get_spatial_dimension()
+        num_comps = int(numpy.prod(shape))
+        pts, alphas, rows, cols, alpha_ids, weights = functional_terms(self.nodes, shape, sd)
+
+        matrix = numpy.zeros((len(self.nodes), len(alphas), len(pts), num_comps), "d")
+        numpy.add.at(matrix, (rows // num_comps, alpha_ids, cols, rows % num_comps), weights)
+        matrix = numpy.reshape(matrix, matrix.shape[:-1] + shape)
+
+        self._interpolation = (pts, alphas, matrix)
+        return self._interpolation
+
     def to_riesz(self, poly_set):
 
-        tshape = self.nodes[0].target_shape
+        tshape = poly_set.get_shape()
         num_nodes = len(self.nodes)
         es = poly_set.get_expansion_set()
         num_exp = es.get_num_members(poly_set.get_embedded_degree())
@@ -49,7 +96,15 @@ class DualSet(object):
 
         self.mat = numpy.zeros(riesz_shape, "d")
 
-        for i in range(len(self.nodes)):
+        # Nodes relying on the generic representation through their
+        # point and derivative dictionaries are done all at once.
+        generic = [i for i, node in enumerate(self.nodes)
+                   if type(node).to_riesz is Functional.to_riesz]
+        if generic:
+            self.mat[generic] = riesz_representation(
+                [self.nodes[i] for i in generic], poly_set)
+
+        for i in sorted(set(range(num_nodes)) - set(generic)):
             self.mat[i][:] = self.nodes[i].to_riesz(poly_set)
 
         return self.mat
@@ -0,0 +1,328 @@
+# Copyright (C) 2019 Imperial College London and others
+#
+# This file is part of FIAT (https://www.fenicsproject.org)
+#
+# SPDX-License-Identifier:    LGPL-3.0-or-later
+
+import hashlib
+import importlib
+import json
+import os
+import shutil
+import tempfile
+from collections import OrderedDict, namedtuple
+from itertools import chain
+
+import numpy
+import pkg_resources
+
+from FIAT import expansions
+from FIAT.finite_element import FiniteElement
+from FIAT.reference_element import Cell, geometric_key
+
+__version__ = pkg_resources.get_distribution("fenics-fiat").version
+
+
+CacheInfo = namedtuple("CacheInfo", ["hits", "misses", "maxsize", "currsize"])
+
+
+def structural_key(obj):
+    """Returns a hashable key describing obj structurally, so that
+    equal keys construct equal elements.  Elements made by an
+    ElementFactory are described by the key they were made with, other
+    elements only compare equal to themselves (and are kept alive by
+    the key, so that a new element cannot take over their id).  Cells are described by
+    their type, vertices and topology."""
+    if isinstance(obj, FiniteElement):
+        return getattr(obj, "_structural_key", ("element", obj))
+    elif isinstance(obj, Cell):
+        return ("cell",) + geometric_key(obj)
+    elif isinstance(obj, numpy.ndarray):
+        return ("array", obj.shape, obj.dtype.str, obj.tobytes())
+    elif isinstance(obj, (list, tuple)):
+        return (type(obj).__name__,) + tuple(structural_key(o) for o in obj)
+    elif isinstance(obj, dict):
+        return ("dict",) + tuple(sorted((k, structural_key(v)) for k, v in obj.items()))
+    else:
+        # Numbers, strings and other hashable arguments
+        hash(obj)
+        return obj
+
+
+def stable_key(key):
+    """Returns a string describing a structural key that is the same in
+    every process, or None if the key involves objects that cannot be
+    described (such as elements not made by a factory)."""
+    if isinstance(key, tuple):
+        parts = [stable_key(k) for k in key]
+        if any(part is None for part in parts):
+            return None
+        return "(" + ",".join(parts) + ")"
+    elif isinstance(key, type):
+        return key.__module__ + "." + key.__qualname__
+    elif isinstance(key, bytes):
+        return hashlib.sha256(key).hexdigest()
+    elif key is None or isinstance(key, (bool, int, float, str, numpy.number)):
+        return repr(key)
+    return None
+
+
+# Numeric arrays with at least this many entries are stored in
+# separate .npy files, which are memory mapped when loaded.
+_min_file_array_size = 64
+
+# Version of the layout of stored elements
+_storage_format = 1
+
+
+def _is_fiat_module(name):
+    return name == "FIAT" or name.startswith("FIAT.")
+
+
+def _class_name(cls):
+    return cls.__module__ + ":" + cls.__qualname__
+
+
+def _fiat_class(name):
+    """Returns the FIAT class of the given name, refusing to look up
+    anything outside FIAT."""
+    module, _, qualname = name.partition(":")
+    if not _is_fiat_module(module):
+        raise ValueError("Refusing to load non-FIAT class %s" % name)
+    cls = importlib.import_module(module)
+    for part in qualname.split("."):
+        cls = getattr(cls, part)
+    if not isinstance(cls, type) or cls.__module__ != module:
+        raise ValueError("%s is not a FIAT class" % name)
+    return cls
+
+
+def _attributes(obj):
+    """Returns the attributes of an object as a dict."""
+    if hasattr(obj, "__dict__"):
+        return vars(obj)
+    names = chain.from_iterable(getattr(cls, "__slots__", ()) for cls in type(obj).__mro__)
+    return {name: getattr(obj, name) for name in names if hasattr(obj, name)}
+
+
+class _ElementWriter(object):
+    """Describes an element by plain metadata, which is stored as JSON,
+    and numeric arrays, which are stored in .npy files.  Objects of FIAT
+    classes are described by their class and attributes, and expansion
+    sets by their cell, so nothing is pickled.  Objects that cannot be
+    described this way (such as functions) raise TypeError."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.num_arrays = 0
+        self.memo = {}
+
+    def describe(self, obj):
+        if obj is None or type(obj) in (bool, int, float, str):
+            return obj
+        elif isinstance(obj, numpy.generic):
+            return {"kind": "scalar", "dtype": obj.dtype.str, "value": obj.item()}
+        elif type(obj) is bytes:
+            return {"kind": "bytes", "value": obj.hex()}
+        elif type(obj) in (tuple, list, set, frozenset):
+            return {"kind": type(obj).__name__, "items": [self.describe(o) for o in obj]}
+        elif type(obj) in (dict, OrderedDict):
+            return {"kind": type(obj).__name__,
+                    "items": [[self.describe(k), self.describe(v)] for k, v in obj.items()]}
+        elif isinstance(obj, type) and _is_fiat_module(obj.__module__):
+            return {"kind": "type", "name": _class_name(obj)}
+
+        # Shared objects are described once and referenced afterwards
+        if id(obj) in self.memo:
+            return {"kind": "ref", "id": self.memo[id(obj)][0]}
+        self.memo[id(obj)] = (len(self.memo), obj)
+        description = {"id": self.memo[id(obj)][0]}
+
+        if type(obj) is numpy.ndarray and obj.dtype.kind in "biufc":
+            description.update(kind="array", dtype=obj.dtype.str, shape=obj.shape,
+                               writeable=obj.flags.writeable)
+            if obj.size >= _min_file_array_size or obj.dtype.kind == "c":
+                description["file"] = "array%d.npy" % self.num_arrays
+                self.num_arrays += 1
+                numpy.save(os.path.join(self.directory, description["file"]), obj)
+            else:
+                description["data"] = obj.ravel().tolist()
+        elif (type(obj).__module__ == expansions.__name__ and
+              type(obj).__name__.endswith("ExpansionSet")):
+            description.update(kind="expansion_set", cell=self.describe(obj.ref_el))
+        elif _is_fiat_module(type(obj).__module__):
+            description.update(kind="object", cls=_class_name(type(obj)),
+                               attributes={name: self.describe(value)
+                                           for name, value in _attributes(obj).items()})
+        else:
+            raise TypeError("Cannot store %r" % (obj,))
+        return description
+
+
+class _ElementReader(object):
+    """Rebuilds an element from the description of an _ElementWriter.
+    Only FIAT classes are instantiated, without calling their
+    constructors, and no pickled data is loaded."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.memo = {}
+
+    def build(self, description):
+        if not isinstance(description, dict):
+            return description
+        kind = description["kind"]
+        if kind == "scalar":
+            return numpy.dtype(description["dtype"]).type(description["value"])
+        elif kind == "bytes":
+            return bytes.fromhex(description["value"])
+        elif kind in ("tuple", "list", "set", "frozenset"):
+            container = {"tuple": tuple, "list": list, "set": set, "frozenset": frozenset}[kind]
+            return container(self.build(d) for d in description["items"])
+        elif kind in ("dict", "OrderedDict"):
+            container = dict if kind == "dict" else OrderedDict
+            return container((self.build(k), self.build(v)) for k, v in description["items"])
+        elif kind == "type":
+            return _fiat_class(description["name"])
+        elif kind == "ref":
+            return self.memo[description["id"]]
+        elif kind == "array":
+            if "file" in description:
+                obj = numpy.load(os.path.join(self.directory, os.path.basename(description["file"])),
+                                 mmap_mode="r", allow_pickle=False)
+            else:
+                obj = numpy.array(description["data"], dtype=description["dtype"])
+                obj = obj.reshape(description["shape"])
+                obj.flags.writeable = description["writeable"]
+        elif kind == "expansion_set":
+            obj = expansions.get_expansion_set(self.build(description["cell"]))
+        elif kind == "object":
+            cls = _fiat_class(description["cls"])
+            obj = object.__new__(cls)
+            # Register before the attributes, which may refer back to obj
+            self.memo[description["id"]] = obj
+            for name, value in description["attributes"].items():
+                object.__setattr__(obj, name, self.build(value))
+        else:
+            raise ValueError("Unknown kind %s in stored element" % kind)
+        self.memo[description["id"]] = obj
+        return obj
+
+
+def save_element(element, directory):
+    """Stores an element in a new directory, which is only created if
+    the whole element could be stored.  The element is described by a
+    JSON file of metadata and .npy files of its numeric arrays."""
+    parent = os.path.dirname(directory)
+    os.makedirs(parent, exist_ok=True)
+    tmp = tempfile.mkdtemp(dir=parent)
+    try:
+        description = _ElementWriter(tmp).describe(element)
+        with open(os.path.join(tmp, "element.json"), "w") as f:
+            json.dump({"format": _storage_format, "element": description}, f)
+        os.rename(tmp, directory)
+    except (TypeError, ValueError, OSError):
+        # Element with objects that cannot be described, or another
+        # process got there first
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def load_element(directory):
+    """Loads an element stored by save_element.  Its large numeric
+    arrays are read-only memory maps of the stored files."""
+    with open(os.path.join(directory, "element.json")) as f:
+        stored = json.load(f)
+    if stored.get("format") != _storage_format:
+        raise ValueError("Unknown format of stored element in %s" % directory)
+    return _ElementReader(directory).build(stored["element"])
+
+
+class ElementFactory(object):
+    """Memoizing constructor of an element class.  Calling the factory
+    with the arguments of the element class returns an element that is
+    shared between all calls with structurally equal arguments, so the
+    element must not be modified.
+
+    element_class: the element class to construct.
+    maxsize: the maximum number of elements kept, the least recently
+        used are dropped first.  None means no limit.
+    cache_dir: an optional directory in which elements are also stored
+        between processes.  Entries are kept per FIAT version, and
+        elements are only stored if their arguments can be described
+        the same way in every process.
+    """
+
+    def __init__(self, element_class, maxsize=None, cache_dir=None):
+        self.element_class = element_class
+        self.maxsize = maxsize
+        self.cache_dir = cache_dir
+        self._cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+
+    def __call__(self, *args, **kwargs):
+        key = (self.element_class, structural_key(args), structural_key(kwargs))
+        try:
+            element = self._cache[key]
+        except KeyError:
+            pass
+        else:
+            self.hits += 1
+            self._cache.move_to_end(key)
+            return element
+
+        self.misses += 1
+        element = self._disk_cached(key, args, kwargs)
+        self._cache[key] = element
+        if self.maxsize is not None and len(self._cache) > self.maxsize:
+            self._cache.popitem(last=False)
+        return element
+
+    def _disk_cached(self, key, args, kwargs):
+        """Loads the element from the disk cache if possible, otherwise
+        constructs (and stores) it."""
+        directory = None
+        if self.cache_dir is not None:
+            description = stable_key(key)
+            if description is not None:
+                digest = hashlib.sha256(description.encode()).hexdigest()
+                directory = os.path.join(self.cache_dir,
+                                         "fiat-%s-%d" % (__version__, _storage_format),
+                                         digest)
+                if os.path.exists(directory):
+                    self.disk_hits += 1
+                    return load_element(directory)
+
+        element = self.element_class(*args, **kwargs)
+        element._structural_key = key
+        if hasattr(element, "poly_set"):
+            # Factored sets are not expanded to dense coefficients
+            poly_set = element.poly_set
+            for array in (poly_set._coeffs,) + tuple(poly_set.get_factors() or ()):
+                if array is not None:
+                    array.flags.writeable = False
+        if directory is not None:
+            save_element(element, directory)
+        return element
+
+    def cache_info(self):
+        """Returns the hit and miss statistics of the factory."""
+        return CacheInfo(self.hits, self.misses, self.maxsize, len(self._cache))
+
+    def cache_clear(self):
+        """Drops all elements and resets the statistics."""
+        self._cache.clear()
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+
+
+def cache_info(factories):
+    """Returns the combined statistics of a dict of factories, such as
+    FIAT.cached_elements."""
+    infos = [factory.cache_info() for factory in factories.values()]
+    return CacheInfo(sum(info.hits for info in infos),
+                     sum(info.misses for info in infos),
+                     None,
+                     sum(info.currsize for info in infos))
@@ -114,6 +114,15 @@ class EnrichedElement(FiniteElement):
 
         return table
 
+    def tabulate_all_entities(self, order, points, dim):
+        """Return tabulated values of derivatives up to given order of
+        basis functions at given points on every entity of dimension
+        dim."""
+        tables = [element.tabulate_all_entities(order, points, dim)
+                  for element in self._elements]
+        return {dtuple: numpy.concatenate([etable[dtuple] for etable in tables], axis=1)
+                for dtuple in tables[0]}
+
     def value_shape(self):
         """Return the value shape of the finite element functions."""
         result, = set(e.value_shape() for e in self._elements)
@@ -7,9 +7,11 @@
 and Sherwin.  These are parametrized over a reference element so as
 to allow users to get coordinates that they want."""
 
-import numpy
+import itertools
 import math
-import sympy
+from functools import lru_cache
+
+import numpy
 from FIAT import reference_element
 from FIAT import jacobi
 
@@ -21,77 +23,184 @@ def jrc(a, b, n):
     return an, bn, cn
 
 
+def _jet_multi_indices(D, order):
+    """Returns all D-tuples of nonnegative integers summing to at most
+    order, sorted by total degree."""
+    alphas = []
+    for r in range(order + 1):
+        for combo in itertools.combinations_with_replacement(range(D), r):
+            alpha = [0] * D
+            for i in combo:
+                alpha[i] += 1
+            alphas.append(tuple(alpha))
+    return alphas
+
+
+class _Jet(object):
+    """Truncated multivariate Taylor expansion of a scalar function about
+    each point of a point set.
+
+    coeffs[k, j] is the Taylor coefficient for the k:th multi-index of
+    _jet_multi_indices(D, order) at the j:th point, i.e. the partial
+    derivative of that multi-index divided by its factorial.  Jets
+    support the arithmetic used by the expansion recurrences, so that
+    running a recurrence on jets of the coordinates differentiates it."""
+
+    # Make numpy scalars defer to our reflected operators
+    __array_ufunc__ = None
+
+    def __init__(self, coeffs, rule):
+        self.coeffs = coeffs
+        self.rule = rule
+
+    def _new(self, coeffs):
+        return _Jet(coeffs, self.rule)
+
+    def __add__(self, other):
+        if isinstance(other, _Jet):
+            return self._new(self.coeffs + other.coeffs)
+        coeffs = self.coeffs.copy()
+        coeffs[0] += other
+        return self._new(coeffs)
+
+    __radd__ = __add__
+
+    def __neg__(self):
+        return self._new(-self.coeffs)
+
+    def __sub__(self, other):
+        return self + (-other)
+
+    def __rsub__(self, other):
+        return (-self) + other
+
+    def __mul__(self, other):
+        if isinstance(other, _Jet):
+            ia, ib, starts = self.rule
+            products = self.coeffs[ia] * other.coeffs[ib]
+            return self._new(numpy.add.reduceat(products, starts, axis=0))
+        return self._new(self.coeffs * other)
+
+    __rmul__ = __mul__
+
+    def __truediv__(self, other):
+        return self._new(self.coeffs / other)
+
+    def __pow__(self, n):
+        result = self
+        for i in range(1, n):
+            result = result * self
+        return result
+
+
 def _tabulate_dpts(tabulator, D, n, order, pts):
-    X = sympy.DeferredVector('x')
-
-    def form_derivative(F):
-        '''Forms the derivative recursively, i.e.,
-        F               -> [F_x, F_y, F_z],
-        [F_x, F_y, F_z] -> [[F_xx, F_xy, F_xz],
-                            [F_yx, F_yy, F_yz],
-                            [F_zx, F_zy, F_zz]]
-        and so forth.
-        '''
-        out = []
-        try:
-            out = [sympy.diff(F, X[j]) for j in range(D)]
-        except (AttributeError, ValueError):
-            # Intercept errors like
-            #  AttributeError: 'list' object has no attribute
-            #  'free_symbols'
-            for f in F:
-                out.append(form_derivative(f))
-        return out
-
-    def numpy_lambdify(X, F):
-        '''Unfortunately, SymPy's own lambdify() doesn't work well with
-        NumPy in that simple functions like
-            lambda x: 1.0,
-        when evaluated with NumPy arrays, return just "1.0" instead of
-        an array of 1s with the same shape as x. This function does that.
-        '''
-        try:
-            lambda_x = [numpy_lambdify(X, f) for f in F]
-        except TypeError:  # 'function' object is not iterable
-            # SymPy's lambdify also works on functions that return arrays.
-            # However, use it componentwise here so we can add 0*x to each
-            # component individually. This is necessary to maintain shapes
-            # if evaluated with NumPy arrays.
-            lmbd_tmp = sympy.lambdify(X, F)
-            lambda_x = lambda x: lmbd_tmp(x) + 0 * x[0]
-        return lambda_x
-
-    def evaluate_lambda(lmbd, x):
-        '''Properly evaluate lambda expressions recursively for iterables.
-        '''
-        try:
-            values = [evaluate_lambda(l, x) for l in lmbd]
-        except TypeError:  # 'function' object is not iterable
-            values = lmbd(x)
-        return values
-
-    # Tabulate symbolically
-    symbolic_tab = tabulator(n, X)
-    # Make sure that the entries of symbolic_tab are lists so we can
-    # append derivatives
-    symbolic_tab = [[phi] for phi in symbolic_tab]
-    #
-    data = (order + 1) * [None]
+    """Tabulates the derivatives up to the given order of all members
+    of an expansion set by running its recurrence (tabulator) on jets
+    of the coordinates.  Returns a list data such that data[r] has shape
+    (num_members, num_points) + r * (D,) and holds the r:th derivative
+    tensor of each member at each point."""
+    pts = numpy.reshape(numpy.asarray(pts, dtype="d"), (-1, D))
+    alphas, X = _coordinate_jets(D, order, pts)
+    index = {alpha: k for k, alpha in enumerate(alphas)}
+
+    jets = tabulator(n, X)
+    coeffs = numpy.array([jet.coeffs for jet in jets])
+
+    # Convert Taylor coefficients into derivative tensors
+    data = []
     for r in range(order + 1):
-        shape = [len(symbolic_tab), len(pts)] + r * [D]
-        data[r] = numpy.empty(shape)
-        for i, phi in enumerate(symbolic_tab):
-            # Evaluate the function numerically using lambda expressions
-            deriv_lambda = numpy_lambdify(X, phi[r])
-            data[r][i] = \
-                numpy.array(evaluate_lambda(deriv_lambda, pts.T)).T
-            # Symbolically compute the next derivative.
-            # This actually happens once too many here; never mind for
-            # now.
-            phi.append(form_derivative(phi[-1]))
+        ks = []
+        scale = []
+        for idx in itertools.product(range(D), repeat=r):
+            alpha = tuple(idx.count(j) for j in range(D))
+            ks.append(index[alpha])
+            scale.append(numpy.prod([math.factorial(a) for a in alpha]))
+        shape = (len(jets), len(pts)) + r * (D,)
+        values = coeffs[:, ks, :] * numpy.reshape(scale, (1, -1, 1))
+        data.append(numpy.reshape(numpy.transpose(values, (0, 2, 1)), shape))
     return data
 
 
+def _coordinate_jets(D, order, pts):
+    """Returns the multi-indices _jet_multi_indices(D, order) and the
+    jets of the D coordinate functions at the points, an array of shape
+    (num_points, D)."""
+    alphas = _jet_multi_indices(D, order)
+    index = {alpha: k for k, alpha in enumerate(alphas)}
+
+    # Product rule for Taylor coefficients: the k:th coefficient of a
+    # product sums a[ia] * b[ib] over the pairs with
+    # alphas[ia] + alphas[ib] == alphas[k], stored grouped by k.
+    triples = sorted((index[tuple(x + y for x, y in zip(alpha, beta))], a, b)
+                     for a, alpha in enumerate(alphas)
+                     for b, beta in enumerate(alphas)
+                     if sum(alpha) + sum(beta) <= order)
+    ks, ia, ib = numpy.transpose(triples)
+    starts = numpy.searchsorted(ks, numpy.arange(len(alphas)))
+    rule = (ia, ib, starts)
+
+    # Jets of the coordinate functions
+    X = []
+    for i in range(D):
+        coeffs = numpy.zeros((len(alphas), len(pts)))
+        coeffs[0] = pts[:, i]
+        if order > 0:
+            coeffs[index[tuple(int(i == j) for j in range(D))]] = 1.0
+        X.append(_Jet(coeffs, rule))
+    return alphas, X
+
+
+def _evaluate_stream(iterate, D, n, coeffs, pts, order):
+    """Evaluates expansions (and their derivatives up to the given
+    order) with coefficients coeffs[c, ..., i] at the points pts[c, j]
+    of each cell c, or at the same points pts[j] on every cell.  The
+    members of the expansion set are generated by iterate one at a
+    time and summed into the result, so that no table of all members
+    at all points is formed.  Returns a dict mapping multi-indices to
+    arrays of shape coeffs.shape[:-1] + (num_points,)."""
+    coeffs = numpy.asarray(coeffs)
+    ncells, vshape = coeffs.shape[0], coeffs.shape[1:-1]
+    pts = numpy.asarray(pts, dtype="d")
+    pts = numpy.broadcast_to(pts, (ncells,) + pts.shape[-2:]) if pts.ndim == 2 else pts
+    npts = pts.shape[1]
+    C = numpy.reshape(coeffs, (ncells, -1, coeffs.shape[-1]))
+
+    alphas, X = _coordinate_jets(D, order, numpy.reshape(pts, (-1, D)))
+    result = numpy.zeros((len(alphas), ncells, C.shape[1], npts))
+    for i, phi in iterate(n, X):
+        values = numpy.reshape(phi.coeffs, (len(alphas), ncells, 1, npts))
+        result += values * C[None, :, :, i, None]
+
+    # Taylor coefficients to derivatives
+    return {alpha: numpy.reshape(result[k], (ncells,) + vshape + (npts,)) *
+            numpy.prod([math.factorial(a) for a in alpha])
+            for k, alpha in enumerate(alphas)}
+
+
+def _jacobi_tables(a, n, x):
+    """Returns P[i, k, j] = P_k^{(a[i], 0)}(x[j]) for k <= n, by the
+    three term recurrence vectorised over a and x."""
+    a = numpy.reshape(numpy.asarray(a, dtype="d"), (-1, 1))
+    P = numpy.empty((len(a), n + 1, len(x)))
+    P[:, 0] = 1.0
+    if n > 0:
+        P[:, 1] = 0.5 * (a + (a + 2.0) * x)
+    for k in range(1, n):
+        an, bn, cn = jrc(a, 0, k)
+        P[:, k + 1] = (an * x + bn) * P[:, k] - cn * P[:, k - 1]
+    return P
+
+
+@lru_cache(maxsize=32)
+def _collapsed_member_degrees(D, n):
+    """Returns the arrays of the degrees (p, q[, r]) in each collapsed
+    direction of the members of the simplex expansion set of degree n
+    in dimension D, in the order of the members."""
+    degrees = [d for d in itertools.product(range(n + 1), repeat=D) if sum(d) <= n]
+    degrees.sort(key=lambda d: tuple(sum(d[i:]) for i in range(D)))
+    return tuple(numpy.transpose(degrees))
+
+
 def xi_triangle(eta):
     """Maps from [-1,1]^2 to the (-1,1) reference triangle."""
     eta1, eta2 = eta
@@ -129,7 +238,7 @@ class LineExpansionSet(object):
     def tabulate(self, n, pts):
         """Returns a numpy array A[i,j] = phi_i(pts[j])"""
         if len(pts) > 0:
-            ref_pts = numpy.array([self.mapping(pt) for pt in pts])
+            ref_pts = numpy.dot(numpy.reshape(numpy.asarray(pts, dtype="d"), (-1, 1)), self.A.T) + self.b
             psitilde_as = jacobi.eval_jacobi_batch(0, 0, n, ref_pts)
 
             results = numpy.zeros((n + 1, len(pts)), type(pts[0][0]))
@@ -145,28 +254,53 @@ class LineExpansionSet(object):
         A[i,j] = D phi_i(pts[j]).  The tuple is returned for
         compatibility with the interfaces of the triangle and
         tetrahedron expansions."""
-        ref_pts = numpy.array([self.mapping(pt) for pt in pts])
-        psitilde_as_derivs = jacobi.eval_jacobi_deriv_batch(0, 0, n, ref_pts)
-
-        # Jacobi polynomials defined on [-1, 1], first derivatives need scaling
-        psitilde_as_derivs *= 2.0 / self.ref_el.volume()
-
-        results = numpy.zeros((n + 1, len(pts)), "d")
-        for k in range(0, n + 1):
-            results[k, :] = psitilde_as_derivs[k, :] * numpy.sqrt(k + 0.5)
-
-        vals = self.tabulate(n, pts)
-        deriv_vals = (results,)
+        vals, derivs = self.tabulate_jet(n, pts, 1)
 
         # Create the ordinary data structure.
         dv = []
         for i in range(vals.shape[0]):
             dv.append([])
             for j in range(vals.shape[1]):
-                dv[-1].append((vals[i][j], [deriv_vals[0][i][j]]))
+                dv[-1].append((vals[i][j], [derivs[i][j]]))
 
         return dv
 
+    def tabulate_jet(self, n, pts, order=1):
+        """Returns a numpy array A[r,i,j] = D^r phi_i(pts[j]) for all
+        derivatives of order r up to the given order."""
+        ref_pts = numpy.dot(numpy.reshape(pts, (-1, 1)), self.A.T) + self.b
+        scale = numpy.sqrt(numpy.arange(n + 1) + 0.5)
+
+        results = numpy.zeros((order + 1, n + 1, len(ref_pts)), "d")
+        for r in range(order + 1):
+            # Jacobi polynomials defined on [-1, 1], derivatives need scaling
+            psitilde_as_derivs = jacobi.eval_jacobi_deriv_batch(0, 0, n, ref_pts, r)
+            results[r] = psitilde_as_derivs * scale[:, None] * self.A[0, 0]**r
+
+        return results
+
+    def evaluate(self, n, coeffs, pts, order=0):
+        """Evaluates the expansions with coefficients coeffs[c, ..., i]
+        and their derivatives up to the given order at the points
+        pts[c, j] of each cell c (or at the points pts[j] on every
+        cell), by Clenshaw summation of the Legendre series.
+        Returns a dict mapping multi-indices to arrays of shape
+        coeffs.shape[:-1] + (num_points,)."""
+        coeffs = numpy.asarray(coeffs)
+        ncells, vshape = coeffs.shape[0], coeffs.shape[1:-1]
+        pts = numpy.asarray(pts, dtype="d")
+        x = numpy.broadcast_to(pts[..., 0] * self.A[0, 0] + self.b[0], (ncells, pts.shape[-2]))
+        x = numpy.reshape(x, (ncells,) + (1,) * len(vshape) + (-1,))
+
+        # Legendre coefficients, with the series index first
+        c = numpy.moveaxis(coeffs, -1, 0) * \
+            numpy.reshape(numpy.sqrt(numpy.arange(n + 1) + 0.5), (-1,) + (1,) * (coeffs.ndim - 1))
+        result = {}
+        for r in range(order + 1):
+            result[(r,)] = numpy.polynomial.legendre.legval(x, c[..., None], tensor=False) * self.A[0, 0]**r
+            c = numpy.polynomial.legendre.legder(c)
+        return result
+
 
 class TriangleExpansionSet(object):
     """Evaluates the orthonormal Dubiner basis on a triangular
@@ -195,6 +329,16 @@ class TriangleExpansionSet(object):
     def _tabulate(self, n, pts):
         '''A version of tabulate() that also works for a single point.
         '''
+        results = ((n + 1) * (n + 2) // 2) * [None]
+        for i, value in self._iterate(n, pts):
+            results[i] = value
+        return results
+
+    def _iterate(self, n, pts):
+        '''Generates the pairs (i, phi_i(pts)) for all members of the
+        expansion set, only keeping the values that the recurrences
+        still need.
+        '''
         m1, m2 = self.A.shape
         ref_pts = [sum(self.A[i][j] * pts[j] for j in range(m2)) + self.b[i]
                    for i in range(m1)]
@@ -202,14 +346,13 @@ class TriangleExpansionSet(object):
         def idx(p, q):
             return (p + q) * (p + q + 1) // 2 + q
 
-        results = ((n + 1) * (n + 2) // 2) * [None]
-
-        results[0] = 1.0 \
+        one = 1.0 \
             + pts[0] - pts[0] \
             + pts[1] - pts[1]
 
         if n == 0:
-            return results
+            yield 0, one
+            return
 
         x = ref_pts[0]
         y = ref_pts[1]
@@ -218,31 +361,24 @@ class TriangleExpansionSet(object):
         f2 = (1.0 - y) / 2.0
         f3 = f2**2
 
-        results[idx(1, 0)] = f1
-
-        for p in range(1, n):
-            a = (2.0 * p + 1) / (1.0 + p)
-            # b = p / (p+1.0)
-            results[idx(p+1, 0)] = a * f1 * results[idx(p, 0)] \
-                - p/(1.0+p) * f3 * results[idx(p-1, 0)]
-
-        for p in range(n):
-            results[idx(p, 1)] = 0.5 * (1+2.0*p+(3.0+2.0*p)*y) \
-                * results[idx(p, 0)]
-
-        for p in range(n - 1):
-            for q in range(1, n - p):
-                (a1, a2, a3) = jrc(2 * p + 1, 0, q)
-                results[idx(p, q+1)] = \
-                    (a1 * y + a2) * results[idx(p, q)] \
-                    - a3 * results[idx(p, q-1)]
-
+        # phi(p, 0) and phi(p - 1, 0)
+        pp, pm = one, None
         for p in range(n + 1):
+            # phi(p, q) and phi(p, q - 1)
+            qq, qm = pp, None
             for q in range(n - p + 1):
-                results[idx(p, q)] *= math.sqrt((p + 0.5) * (p + q + 1.0))
-
-        return results
-        # return self.scale * results
+                if q == 1:
+                    qq, qm = 0.5 * (1+2.0*p+(3.0+2.0*p)*y) * qq, qq
+                elif q > 1:
+                    (a1, a2, a3) = jrc(2 * p + 1, 0, q - 1)
+                    qq, qm = (a1 * y + a2) * qq - a3 * qm, qq
+                yield idx(p, q), qq * math.sqrt((p + 0.5) * (p + q + 1.0))
+
+            if p == 0:
+                pp, pm = f1, pp
+            elif p < n:
+                a = (2.0 * p + 1) / (1.0 + p)
+                pp, pm = a * f1 * pp - p/(1.0+p) * f3 * pm, pp
 
     def tabulate_derivatives(self, n, pts):
         order = 1
@@ -260,6 +396,47 @@ class TriangleExpansionSet(object):
     def tabulate_jet(self, n, pts, order=1):
         return _tabulate_dpts(self._tabulate, 2, n, order, numpy.array(pts))
 
+    def evaluate(self, n, coeffs, pts, order=0):
+        """Evaluates the expansions with coefficients coeffs[c, ..., i]
+        and their derivatives up to the given order at the points
+        pts[c, j] of each cell c (or at the points pts[j] on every
+        cell), without tabulating all members of the set at all points.
+        Returns a dict mapping multi-indices to arrays of shape
+        coeffs.shape[:-1] + (num_points,)."""
+        return _evaluate_stream(self._iterate, 2, n, coeffs, pts, order)
+
+    def tabulate_collapsed(self, n, eta):
+        """Returns the factors A[p, i] and B[p, q, j] of the members
+        phi(p, q) = A[p, i] * B[p, q, j] at the points with collapsed
+        coordinates (eta[0][i], eta[1][j]), see contract_collapsed."""
+        a, b = [numpy.asarray(e, dtype="d") for e in eta]
+        p = numpy.arange(n + 1)
+        A = _jacobi_tables([0], n, a)[0] * numpy.sqrt(p + 0.5)[:, None]
+        B = (0.5 * (1.0 - b))**p[:, None, None] * _jacobi_tables(2 * p + 1, n, b) * \
+            numpy.sqrt(numpy.add.outer(p, p) + 1.0)[:, :, None]
+        return A, B
+
+    def contract_collapsed(self, n, coeffs, factors):
+        """Returns sum_i coeffs[..., i] phi_i at the tensor product of
+        the collapsed coordinates of a collapsed quadrature rule (with
+        the second direction running fastest), given the factors
+        returned by tabulate_collapsed, as an array of shape
+        coeffs.shape[:-1] + (num_points,).  The sum is factorised into
+        the two directions as in Karniadakis & Sherwin."""
+        coeffs = numpy.asarray(coeffs)
+        A, B = factors
+        if n == 0:
+            # The recurrence leaves the constant unnormalised
+            return numpy.repeat(coeffs, A.shape[1] * B.shape[2], axis=-1)
+        p, q = _collapsed_member_degrees(2, n)
+        C = numpy.zeros((n + 1, n + 1, int(numpy.prod(coeffs.shape[:-1]))))
+        C[p, q] = numpy.reshape(coeffs, (-1, coeffs.shape[-1])).T
+
+        # Sum over q, then over p
+        G = numpy.matmul(numpy.transpose(C, (0, 2, 1)), B)
+        V = numpy.tensordot(A, G, (0, 0))
+        return numpy.reshape(numpy.transpose(V, (1, 0, 2)), coeffs.shape[:-1] + (-1,))
+
 
 class TetrahedronExpansionSet(object):
     """Collapsed orthonormal polynomial expanion on a tetrahedron."""
@@ -287,6 +464,16 @@ class TetrahedronExpansionSet(object):
     def _tabulate(self, n, pts):
         '''A version of tabulate() that also works for a single point.
         '''
+        results = ((n + 1) * (n + 2) * (n + 3) // 6) * [None]
+        for i, value in self._iterate(n, pts):
+            results[i] = value
+        return results
+
+    def _iterate(self, n, pts):
+        '''Generates the pairs (i, phi_i(pts)) for all members of the
+        expansion set, only keeping the values that the recurrences
+        still need.
+        '''
         m1, m2 = self.A.shape
         ref_pts = [sum(self.A[i][j] * pts[j] for j in range(m2)) + self.b[i]
                    for i in range(m1)]
@@ -294,14 +481,14 @@ class TetrahedronExpansionSet(object):
         def idx(p, q, r):
             return (p + q + r)*(p + q + r + 1)*(p + q + r + 2)//6 + (q + r)*(q + r + 1)//2 + r
 
-        results = ((n + 1) * (n + 2) * (n + 3) // 6) * [None]
-        results[0] = 1.0 \
+        one = 1.0 \
             + pts[0] - pts[0] \
             + pts[1] - pts[1] \
             + pts[2] - pts[2]
 
         if n == 0:
-            return results
+            yield 0, one
+            return
 
         x = ref_pts[0]
         y = ref_pts[1]
@@ -313,48 +500,36 @@ class TetrahedronExpansionSet(object):
         factor4 = 0.5 * (1 - z)
         factor5 = factor4**2
 
-        results[idx(1, 0, 0)] = factor1
-        for p in range(1, n):
-            a1 = (2.0 * p + 1.0) / (p + 1.0)
-            a2 = p / (p + 1.0)
-            results[idx(p+1, 0, 0)] = a1 * factor1 * results[idx(p, 0, 0)] \
-                - a2 * factor2 * results[idx(p-1, 0, 0)]
-
-        # q = 1
-        for p in range(0, n):
-            results[idx(p, 1, 0)] = results[idx(p, 0, 0)] \
-                * (p * (1.0 + y) + (2.0 + 3.0 * y + z) / 2)
-
-        for p in range(0, n - 1):
-            for q in range(1, n - p):
-                (aq, bq, cq) = jrc(2 * p + 1, 0, q)
-                qmcoeff = aq * factor3 + bq * factor4
-                qm1coeff = cq * factor5
-                results[idx(p, q+1, 0)] = qmcoeff * results[idx(p, q, 0)] \
-                    - qm1coeff * results[idx(p, q-1, 0)]
-
-        # now handle r=1
-        for p in range(n):
-            for q in range(n - p):
-                results[idx(p, q, 1)] = results[idx(p, q, 0)] \
-                    * (1.0 + p + q + (2.0 + q + p) * z)
-
-        # general r by recurrence
-        for p in range(n - 1):
-            for q in range(0, n - p - 1):
-                for r in range(1, n - p - q):
-                    ar, br, cr = jrc(2 * p + 2 * q + 2, 0, r)
-                    results[idx(p, q, r+1)] = \
-                        (ar * z + br) * results[idx(p, q, r)] \
-                        - cr * results[idx(p, q, r-1)]
-
+        # phi(p, 0, 0) and phi(p - 1, 0, 0)
+        pp, pm = one, None
         for p in range(n + 1):
+            # phi(p, q, 0) and phi(p, q - 1, 0)
+            qq, qm = pp, None
             for q in range(n - p + 1):
+                if q == 1:
+                    qq, qm = qq * (p * (1.0 + y) + (2.0 + 3.0 * y + z) / 2), qq
+                elif q > 1:
+                    (aq, bq, cq) = jrc(2 * p + 1, 0, q - 1)
+                    qmcoeff = aq * factor3 + bq * factor4
+                    qm1coeff = cq * factor5
+                    qq, qm = qmcoeff * qq - qm1coeff * qm, qq
+
+                # phi(p, q, r) and phi(p, q, r - 1)
+                rr, rm = qq, None
                 for r in range(n - p - q + 1):
-                    results[idx(p, q, r)] *= \
-                        math.sqrt((p+0.5)*(p+q+1.0)*(p+q+r+1.5))
-
-        return results
+                    if r == 1:
+                        rr, rm = rr * (1.0 + p + q + (2.0 + q + p) * z), rr
+                    elif r > 1:
+                        ar, br, cr = jrc(2 * p + 2 * q + 2, 0, r - 1)
+                        rr, rm = (ar * z + br) * rr - cr * rm, rr
+                    yield idx(p, q, r), rr * math.sqrt((p+0.5)*(p+q+1.0)*(p+q+r+1.5))
+
+            if p == 0:
+                pp, pm = factor1, pp
+            elif p < n:
+                a1 = (2.0 * p + 1.0) / (p + 1.0)
+                a2 = p / (p + 1.0)
+                pp, pm = a1 * factor1 * pp - a2 * factor2 * pm, pp
 
     def tabulate_derivatives(self, n, pts):
         order = 1
@@ -373,16 +548,186 @@ class TetrahedronExpansionSet(object):
     def tabulate_jet(self, n, pts, order=1):
         return _tabulate_dpts(self._tabulate, 3, n, order, numpy.array(pts))
 
+    def evaluate(self, n, coeffs, pts, order=0):
+        """Evaluates the expansions with coefficients coeffs[c, ..., i]
+        and their derivatives up to the given order at the points
+        pts[c, j] of each cell c (or at the points pts[j] on every
+        cell), without tabulating all members of the set at all points.
+        Returns a dict mapping multi-indices to arrays of shape
+        coeffs.shape[:-1] + (num_points,)."""
+        return _evaluate_stream(self._iterate, 3, n, coeffs, pts, order)
+
+    def tabulate_collapsed(self, n, eta):
+        """Returns the factors A[p, i], B[p, q, j] and C[p + q, r, k]
+        of the members phi(p, q, r) = A[p, i] * B[p, q, j] * C[p + q, r, k]
+        at the points with collapsed coordinates
+        (eta[0][i], eta[1][j], eta[2][k]), see contract_collapsed."""
+        a, b, c = [numpy.asarray(e, dtype="d") for e in eta]
+        p = numpy.arange(n + 1)
+        A = _jacobi_tables([0], n, a)[0] * numpy.sqrt(p + 0.5)[:, None]
+        B = (0.5 * (1.0 - b))**p[:, None, None] * _jacobi_tables(2 * p + 1, n, b) * \
+            numpy.sqrt(numpy.add.outer(p, p) + 1.0)[:, :, None]
+        C = (0.5 * (1.0 - c))**p[:, None, None] * _jacobi_tables(2 * p + 2, n, c) * \
+            numpy.sqrt(numpy.add.outer(p, p) + 1.5)[:, :, None]
+        return A, B, C
+
+    def contract_collapsed(self, n, coeffs, factors):
+        """Returns sum_i coeffs[..., i] phi_i at the tensor product of
+        the collapsed coordinates of a collapsed quadrature rule (with
+        the third direction running fastest), given the factors
+        returned by tabulate_collapsed, as an array of shape
+        coeffs.shape[:-1] + (num_points,).  The sum is factorised into
+        the three directions as in Karniadakis & Sherwin."""
+        coeffs = numpy.asarray(coeffs)
+        A, B, C = factors
+        if n == 0:
+            # The recurrence leaves the constant unnormalised
+            return numpy.repeat(coeffs, A.shape[1] * B.shape[2] * C.shape[2], axis=-1)
+        p, q, r = _collapsed_member_degrees(3, n)
+        K = int(numpy.prod(coeffs.shape[:-1]))
+        D = numpy.zeros((n + 1, n + 1, K, n + 1))
+        D[p, q, :, r] = numpy.reshape(coeffs, (K, coeffs.shape[-1])).T
+
+        # Sum over r, then q, then p.  C is only needed for p + q <= n,
+        # where the coefficients do not vanish.
+        s = numpy.minimum(numpy.add.outer(numpy.arange(n + 1), numpy.arange(n + 1)), n)
+        H = numpy.matmul(D, C[s])
+        G = numpy.matmul(numpy.transpose(B, (0, 2, 1)), numpy.reshape(H, (n + 1, n + 1, -1)))
+        V = numpy.tensordot(A, G, (0, 0))
+        V = numpy.reshape(V, V.shape[:2] + (K, -1))
+        return numpy.reshape(numpy.transpose(V, (2, 0, 1, 3)), coeffs.shape[:-1] + (-1,))
+
+
+class TensorLegendreExpansionSet(object):
+    """Evaluates the tensor product of the Legendre bases of the
+    directions of a quadrilateral or hexahedral reference element.
+    The expansion set of degree n spans the polynomials of degree at
+    most n in each direction, and member (i_1, ..., i_D) is numbered
+    with the last direction running fastest."""
+
+    def __init__(self, ref_el):
+        if ref_el.get_shape() not in (reference_element.QUADRILATERAL,
+                                      reference_element.HEXAHEDRON):
+            raise Exception("Must have a quadrilateral or hexahedron")
+        self.ref_el = ref_el
+        self.lines = [LineExpansionSet(c) for c in ref_el.product.cells]
+
+    def get_num_members(self, n):
+        return (n + 1) ** len(self.lines)
+
+    def _line_jets(self, n, pts, order):
+        """Returns the arrays J[r, i, j] = D^r phi_i(pts[j]) of the
+        Legendre bases of every direction."""
+        pts = numpy.reshape(numpy.asarray(pts, dtype="d"), (-1, len(self.lines)))
+        return [line.tabulate_jet(n, pts[:, k], order)
+                for k, line in enumerate(self.lines)]
+
+    @staticmethod
+    def _product(tables):
+        """Returns the table of the products of the members of the
+        tables of the directions."""
+        result = tables[0]
+        for table in tables[1:]:
+            result = numpy.reshape(result[:, None, :] * table[None, :, :],
+                                   (-1, table.shape[-1]))
+        return result
+
+    def tabulate(self, n, pts):
+        """Returns a numpy array A[i,j] = phi_i(pts[j])"""
+        if len(pts) == 0:
+            return numpy.array([])
+        return self._product([jet[0] for jet in self._line_jets(n, pts, 0)])
+
+    def tabulate_derivatives(self, n, pts):
+        order = 1
+        data = self.tabulate_jet(n, pts, order)
+        m = data[0].shape[0]
+        n = data[0].shape[1]
+        data2 = [[tuple([data[r][i][j] for r in range(order+1)])
+                  for j in range(n)]
+                 for i in range(m)]
+        return data2
+
+    def tabulate_jet(self, n, pts, order=1):
+        """Returns a list data such that data[r] has shape
+        (num_members, num_points) + r * (D,) and holds the r:th
+        derivative tensor of each member at each point."""
+        D = len(self.lines)
+        jets = self._line_jets(n, pts, order)
+        tables = {}
+        data = []
+        for r in range(order + 1):
+            values = []
+            for idx in itertools.product(range(D), repeat=r):
+                alpha = tuple(idx.count(k) for k in range(D))
+                if alpha not in tables:
+                    tables[alpha] = self._product([jet[a] for jet, a in zip(jets, alpha)])
+                values.append(tables[alpha])
+            shape = values[0].shape + r * (D,)
+            data.append(numpy.reshape(numpy.moveaxis(numpy.array(values), 0, -1), shape))
+        return data
+
+    def get_dmats(self, n):
+        """Returns the matrices dmats such that column j of dmats[i]
+        holds the expansion coefficients of the derivative in direction
+        i of the j:th member, see polynomial_set.form_dmats."""
+        dmats = []
+        for k, line in enumerate(self.lines):
+            # Derivatives of the scaled Legendre polynomials
+            scale = numpy.sqrt(numpy.arange(n + 1) + 0.5)
+            D1 = numpy.zeros((n + 1, n + 1))
+            D1[:n] = numpy.polynomial.legendre.legder(numpy.eye(n + 1))
+            D1 = D1 * line.A[0, 0] * scale[None, :] / scale[:, None]
+            dmat = numpy.ones((1, 1))
+            for i in range(len(self.lines)):
+                dmat = numpy.kron(dmat, D1 if i == k else numpy.eye(n + 1))
+            dmats.append(dmat)
+        return dmats
+
+    def evaluate(self, n, coeffs, pts, order=0):
+        """Evaluates the expansions with coefficients coeffs[c, ..., i]
+        and their derivatives up to the given order at the points
+        pts[c, j] of each cell c (or at the points pts[j] on every
+        cell), by sum factorisation over the directions.
+        Returns a dict mapping multi-indices to arrays of shape
+        coeffs.shape[:-1] + (num_points,)."""
+        D = len(self.lines)
+        coeffs = numpy.asarray(coeffs)
+        ncells, vshape = coeffs.shape[0], coeffs.shape[1:-1]
+        pts = numpy.asarray(pts, dtype="d")
+        npts = pts.shape[-2]
+        jets = [numpy.reshape(jet, (order + 1, n + 1, -1, npts))
+                for jet in self._line_jets(n, pts, order)]
+        jets = [numpy.broadcast_to(jet, (order + 1, n + 1, ncells, npts)) for jet in jets]
+        C = numpy.reshape(coeffs, (ncells, -1) + D * (n + 1,))
+
+        result = {}
+        for alpha in _jet_multi_indices(D, order):
+            x = numpy.einsum("cv...i,icp->cv...p", C, jets[-1][alpha[-1]])
+            for k in reversed(range(D - 1)):
+                x = numpy.einsum("cv...ip,icp->cv...p", x, jets[k][alpha[k]])
+            result[alpha] = numpy.reshape(x, (ncells,) + vshape + (npts,))
+        return result
+
 
 def get_expansion_set(ref_el):
     """Returns an ExpansionSet instance appopriate for the given
-    reference element."""
+    reference element.  Expansion sets are shared between all calls
+    with reference elements of the same type, vertices and topology."""
+    return _get_expansion_set(reference_element.geometric_key(ref_el), ref_el)
+
+
+@lru_cache(maxsize=32)
+def _get_expansion_set(key, ref_el):
     if ref_el.get_shape() == reference_element.LINE:
         return LineExpansionSet(ref_el)
     elif ref_el.get_shape() == reference_element.TRIANGLE:
         return TriangleExpansionSet(ref_el)
     elif ref_el.get_shape() == reference_element.TETRAHEDRON:
         return TetrahedronExpansionSet(ref_el)
+    elif ref_el.get_shape() in (reference_element.QUADRILATERAL,
+                                reference_element.HEXAHEDRON):
+        return TensorLegendreExpansionSet(ref_el)
     else:
         raise Exception("Unknown reference element type.")
 
@@ -396,5 +741,9 @@ def polynomial_dimension(ref_el, degree):
         return max((degree + 1) * (degree + 2) // 2, 0)
     elif ref_el.get_shape() == reference_element.TETRAHEDRON:
         return max(0, (degree + 1) * (degree + 2) * (degree + 3) // 6)
+    elif ref_el.get_shape() == reference_element.QUADRILATERAL:
+        return max(0, degree + 1) ** 2
+    elif ref_el.get_shape() == reference_element.HEXAHEDRON:
+        return max(0, degree + 1) ** 3
     else:
         raise Exception("Unknown reference element type.")
@@ -10,7 +10,8 @@
 
 import numpy
 
-from FIAT.polynomial_set import PolynomialSet
+from FIAT.polynomial_set import PolynomialSet, LazyTabulation, derivative_indices
+from FIAT.quadrature import QuadratureRule
 from FIAT.quadrature_schemes import create_quadrature
 
 
@@ -91,6 +92,61 @@ class FiniteElement(object):
         """
         raise NotImplementedError("Must be specified in the element subclass of FiniteElement.")
 
+    def tabulate_array(self, order, points, entity=None, out=None):
+        """Return tabulated values of derivatives up to given order of
+        basis functions at given points as one array
+        A[k, i, ..., j], the derivative derivative_indices(sd, order)[k]
+        of the i:th basis function at the j:th point, where sd is the
+        spatial dimension.
+
+        :arg order: The maximum order of derivative, or a collection of
+                    multi-indices if tabulate supports them.
+        :arg points: An iterable of points.
+        :arg entity: Optional (dimension, entity number) pair
+                     indicating which topological entity of the
+                     reference element to tabulate on.
+        :arg out: Optional array to write the result to.
+        """
+        alphas = derivative_indices(self.ref_el.get_spatial_dimension(), order)
+        table = self.tabulate(order, points, entity)
+        shape = (len(alphas),) + table[alphas[0]].shape
+        if out is None:
+            out = numpy.empty(shape, dtype=table[alphas[0]].dtype)
+        elif out.shape != shape:
+            raise ValueError("Expected an output array of shape %s, not %s" % (shape, out.shape))
+        for k, alpha in enumerate(alphas):
+            out[k] = table[alpha]
+        return out
+
+    def tabulate_lazy(self, order, points, entity=None):
+        """Return tabulated values of derivatives up to given order of
+        basis functions at given points as a mapping like tabulate,
+        which only tabulates when an entry is first looked up.  This
+        tabulates all derivatives at once, subclasses may compute the
+        entries one by one."""
+        alphas = derivative_indices(self.ref_el.get_spatial_dimension(), order)
+        tables = []
+
+        def tabulate(alpha):
+            if not tables:
+                tables.append(self.tabulate(order, points, entity))
+            return tables[0][alpha]
+        return LazyTabulation(alphas, tabulate)
+
+    def tabulate_all_entities(self, order, points, dim):
+        """Return tabulated values of derivatives up to given order of
+        basis functions at given points on every entity of dimension
+        dim.  The tables are stacked, with the entity number as first
+        axis.
+
+        :arg order: The maximum order of derivative.
+        :arg points: An iterable of points on the reference entity.
+        :arg dim: The entity dimension (`tuple` for tensor product cells).
+        """
+        num_entities = len(self.ref_el.get_topology()[dim])
+        return stack_tables([self.tabulate(order, points, (dim, e))
+                             for e in range(num_entities)])
+
     @staticmethod
     def is_nodal():
         """True if primal and dual bases are orthogonal. If false,
@@ -109,45 +165,88 @@ class CiarletElement(FiniteElement):
     basis generated from polynomials encoded in a `PolynomialSet`.
     """
 
-    def __init__(self, poly_set, dual, order, formdegree=None, mapping="affine", ref_el=None):
+    def __init__(self, poly_set, dual, order, formdegree=None, mapping="affine", ref_el=None,
+                 nodal=False):
+        """If nodal is True, the members of poly_set are taken to be
+        dual to the nodes already (as for a subset of the basis of
+        another CiarletElement), so that V is the identity."""
         ref_el = ref_el or poly_set.get_reference_element()
         super(CiarletElement, self).__init__(ref_el, dual, order, formdegree, mapping)
 
-        # build generalized Vandermonde matrix
-        old_coeffs = poly_set.get_coeffs()
-        dualmat = dual.to_riesz(poly_set)
-
-        shp = dualmat.shape
-        if len(shp) > 2:
-            num_cols = numpy.prod(shp[1:])
-
-            A = numpy.reshape(dualmat, (dualmat.shape[0], num_cols))
-            B = numpy.reshape(old_coeffs, (old_coeffs.shape[0], num_cols))
+        num_members = poly_set.get_num_members()
+        factors = poly_set.get_factors()
+        new_factors = None
+
+        if nodal:
+            V = numpy.eye(num_members)
+            self._V_factors = (V, V)
+            if factors is None:
+                new_coeffs = poly_set.get_coeffs()
+            else:
+                new_coeffs, new_factors = None, factors
         else:
-            A = dualmat
-            B = old_coeffs
-
-        V = numpy.dot(A, numpy.transpose(B))
+            # build generalized Vandermonde matrix
+            dualmat = dual.to_riesz(poly_set)
+            num_exp = dualmat.shape[-1]
+            A = numpy.reshape(dualmat, (dualmat.shape[0], -1, num_exp))
+            if factors is None:
+                B = numpy.reshape(poly_set.get_coeffs(), (num_members, -1))
+                V = numpy.dot(numpy.reshape(A, (A.shape[0], -1)), numpy.transpose(B))
+            else:
+                # Contract with the scalar coefficients and components of
+                # a factored set, without forming its dense coefficients
+                components = numpy.reshape(factors[0], (num_members, -1))
+                AS = numpy.dot(numpy.reshape(A, (-1, num_exp)), numpy.transpose(factors[1]))
+                AS = numpy.reshape(AS, A.shape[:2] + (num_members,))
+                V = numpy.einsum("icm,mc->im", AS, components)
+
+            if V.shape[0] != V.shape[1]:
+                raise numpy.linalg.LinAlgError("Vandermonde matrix is not square: %d nodes for %d members"
+                                               % V.shape)
+            # Factorise V^T = QR once, the new coefficients solve
+            # V^T C = B and the factors are kept for later solves.
+            # Ill-conditioning is left to vandermonde_condition_number,
+            # only numerically singular matrices are rejected.
+            self._V_factors = numpy.linalg.qr(numpy.transpose(V))
+            diag = numpy.abs(numpy.diag(self._V_factors[1]))
+            if diag.min() <= num_members * numpy.finfo(float).eps * diag.max():
+                raise numpy.linalg.LinAlgError("Singular matrix: the nodes are not unisolvent")
+            if factors is not None:
+                # The new coefficients are dense anyway, so the right
+                # hand side is formed from the factors
+                B = numpy.reshape(components[:, :, None] * factors[1][:, None, :],
+                                  (num_members, -1))
+            new_coeffs = numpy.reshape(self.solve_vandermonde(B, transpose=True),
+                                       (num_members,) + poly_set.get_shape() + (num_exp,))
         self.V = V
 
-        Vinv = numpy.linalg.inv(V)
-
-        new_coeffs_flat = numpy.dot(numpy.transpose(Vinv), B)
-
-        new_shp = tuple([new_coeffs_flat.shape[0]] + list(shp[1:]))
-        new_coeffs = numpy.reshape(new_coeffs_flat, new_shp)
-
         self.poly_set = PolynomialSet(ref_el,
                                       poly_set.get_degree(),
                                       poly_set.get_embedded_degree(),
                                       poly_set.get_expansion_set(),
                                       new_coeffs,
-                                      poly_set.get_dmats())
+                                      poly_set.get_dmats(),
+                                      factors=new_factors)
 
     def degree(self):
         "Return the degree of the (embedding) polynomial space."
         return self.poly_set.get_embedded_degree()
 
+    def solve_vandermonde(self, rhs, transpose=False):
+        """Solves V x = rhs, or V^T x = rhs if transpose is True, where
+        V[i, j] is the i:th node applied to the j:th member of the
+        polynomial set the element was constructed from.  This reuses
+        the QR factorisation of V^T computed by the constructor."""
+        Q, R = self._V_factors
+        if transpose:
+            return _solve_triangular(R, numpy.dot(numpy.transpose(Q), rhs))
+        return numpy.dot(Q, _solve_triangular(numpy.transpose(R), rhs, lower=True))
+
+    def vandermonde_condition_number(self):
+        """Returns the condition number (in the 2-norm) of V, see
+        solve_vandermonde."""
+        return numpy.linalg.cond(self.V)
+
     def get_nodal_basis(self):
         """Return the nodal basis, encoded as a PolynomialSet object,
         for the finite element."""
@@ -162,19 +261,86 @@ class CiarletElement(FiniteElement):
         """Return tabulated values of derivatives up to given order of
         basis functions at given points.
 
-        :arg order: The maximum order of derivative.
-        :arg points: An iterable of points.
+        :arg order: The maximum order of derivative, or a collection
+                    of multi-indices to tabulate only those.
+        :arg points: An iterable of points, or a quadrature rule.
+                     Collapsed quadrature rules on the cell are
+                     tabulated by sum factorisation.
         :arg entity: Optional (dimension, entity number) pair
                      indicating which topological entity of the
                      reference element to tabulate on.  If ``None``,
                      default cell-wise tabulation is performed.
         """
+        return self.poly_set.tabulate(self._cell_points(points, entity), order)
+
+    def tabulate_array(self, order, points, entity=None, out=None):
+        """Return tabulated values of derivatives up to given order of
+        basis functions at given points as one array, see
+        FiniteElement.tabulate_array."""
+        return self.poly_set.tabulate_array(self._cell_points(points, entity), order, out=out)
+
+    def tabulate_lazy(self, order, points, entity=None):
+        """Return tabulated values of derivatives up to given order of
+        basis functions at given points as a mapping, which computes
+        each derivative when it is first looked up."""
+        return self.poly_set.tabulate_lazy(self._cell_points(points, entity), order)
+
+    def modal_coefficients(self, dofs):
+        """Converts the degrees of freedom dofs[..., i] of functions into
+        the coefficients of the functions in the expansion set of the
+        polynomial set, of shape dofs.shape[:-1] + value_shape +
+        (num_expansion_members,)."""
+        return numpy.tensordot(dofs, self.poly_set.get_coeffs(), 1)
+
+    def evaluate(self, dofs, points, order=0):
+        """Evaluates functions given by their degrees of freedom
+        dofs[c, i] on a batch of cells c at reference points points[c, j]
+        (or at the same points points[j] on every cell).  The functions
+        are summed from their expansion coefficients by the recurrences
+        of the expansion set, the table of all basis functions at all
+        points is never formed.
+
+        :arg dofs: An array of shape (ncells, ndofs).
+        :arg points: An array of shape (ncells, npts, sd) or (npts, sd).
+        :arg order: The maximum order of derivative.
+
+        :returns: a dict mapping multi-indices to arrays of shape
+                  (ncells,) + value_shape + (npts,).
+        """
+        modal = self.modal_coefficients(numpy.asarray(dofs))
+        return self.poly_set.get_expansion_set().evaluate(self.poly_set.get_embedded_degree(),
+                                                          modal, points, order)
+
+    def _cell_points(self, points, entity):
+        """Maps points on the given entity to the cell.  Quadrature
+        rules on the cell are passed on to the polynomial set."""
         if entity is None:
             entity = (self.ref_el.get_spatial_dimension(), 0)
 
         entity_dim, entity_id = entity
-        transform = self.ref_el.get_entity_transform(entity_dim, entity_id)
-        return self.poly_set.tabulate(list(map(transform, points)), order)
+        if isinstance(points, QuadratureRule):
+            if entity_dim == self.ref_el.get_dimension():
+                return points
+            points = points.get_points()
+        C, offset = self.ref_el.get_entity_affine_map(entity_dim, entity_id)
+        if numpy.ndim(points) != 1 or C.shape[1] <= 1:
+            points = point_array(points, C.shape[1])
+        # else a single point, tabulated without a point axis
+        return numpy.dot(points, C.T) + offset
+
+    def tabulate_all_entities(self, order, points, dim):
+        """Return tabulated values of derivatives up to given order of
+        basis functions at given points on every entity of dimension
+        dim, see FiniteElement.tabulate_all_entities.  The points of all
+        entities are tabulated together."""
+        num_entities = len(self.ref_el.get_topology()[dim])
+        maps = [self.ref_el.get_entity_affine_map(dim, e) for e in range(num_entities)]
+        points = point_array(points, maps[0][0].shape[1])
+        cell_points = numpy.concatenate([numpy.dot(points, C.T) + offset
+                                         for C, offset in maps])
+        table = self.poly_set.tabulate(cell_points, order)
+        return {alpha: numpy.moveaxis(numpy.reshape(vals, vals.shape[:-1] + (num_entities, len(points))), -2, 0)
+                for alpha, vals in table.items()}
 
     def value_shape(self):
         "Return the value shape of the finite element functions."
@@ -199,6 +365,39 @@ class CiarletElement(FiniteElement):
         return True
 
 
+def stack_tables(tables):
+    """Stacks a list of tabulations (dicts of arrays with the same
+    keys) along a new first axis."""
+    return {alpha: numpy.array([table[alpha] for table in tables])
+            for alpha in tables[0]}
+
+
+def point_array(points, dim):
+    """Returns an iterable of points of dimension dim as an (npts, dim)
+    array, which also works for no points and for points of dimension
+    zero."""
+    points = numpy.asarray(points, dtype=float)
+    if points.size:
+        return numpy.reshape(points, (-1, dim))
+    return numpy.reshape(points, (len(points), dim))
+
+
+def _solve_triangular(T, b, lower=False, block_size=64):
+    """Solves T x = b for an upper (or lower) triangular matrix T by
+    block substitution, b may have several columns.  The updates are
+    matrix products, and only the small diagonal blocks are solved
+    directly."""
+    x = numpy.array(b, dtype=numpy.result_type(T, b, float))
+    n = T.shape[0]
+    starts = range(0, n, block_size)
+    for start in (starts if lower else reversed(starts)):
+        stop = min(start + block_size, n)
+        done = slice(0, start) if lower else slice(stop, n)
+        x[start:stop] -= numpy.dot(T[start:stop, done], x[done])
+        x[start:stop] = numpy.linalg.solve(T[start:stop, start:stop], x[start:stop])
+    return x
+
+
 def entity_support_dofs(elem, entity_dim):
     """Return the map of entity id to the degrees of freedom for which the
     corresponding basis functions take non-zero values
@@ -226,7 +425,7 @@ def entity_support_dofs(elem, entity_dim):
     result = {}
     for f in elem.entity_dofs()[entity_dim].keys():
         entity_transform = ref_el.get_entity_transform(entity_dim, f)
-        points = list(map(entity_transform, quad.get_points()))
+        points = entity_transform(quad.get_points())
 
         # Integrate the square of the basis functions on the facet.
         vals = numpy.double(elem.tabulate(0, points)[(0,) * dim])
@@ -11,7 +11,6 @@
 # - type information
 
 from collections import OrderedDict
-from itertools import chain
 import numpy
 import sympy
 
@@ -31,6 +30,200 @@ def index_iterator(shp):
             for foo in index_iterator(shp_foo):
                 yield [i] + foo
 
+
+def derivative_values(jet, alpha):
+    """Returns the values of the derivative given by the multi-index
+    alpha, with shape (num_members, num_points), from a jet tabulated by
+    an expansion set."""
+    sd = len(alpha)
+    order = sum(alpha)
+    vals = numpy.asarray(jet[order])
+    vals = numpy.reshape(vals, vals.shape[:2] + (sd,) * order)
+    idx = tuple(i for i, a in enumerate(alpha) for count in range(a))
+    return vals[(Ellipsis,) + idx]
+
+
+class FunctionalArrays(object):
+    """Compact representation of a weighted sum of (components of
+    derivatives of) a function evaluated at points, as stored by
+    Functional.  Each term of the sum has a point, a weight, a component
+    and, for derivatives, a multi-index.
+
+    points: array of shape (num_points, sd).
+    point_ids: the index into points of each term.
+    weights: the weight of each term.
+    components: integer array of shape (num_terms, rank) with the
+        component of each term, padded with -1 for terms with fewer
+        indices.
+    alphas: None for point evaluations, otherwise an integer array of
+        shape (num_terms, sd) with the multi-index of each term.
+    """
+
+    __slots__ = ("points", "point_ids", "weights", "components", "alphas")
+
+    def __init__(self, points, point_ids, weights, components, alphas=None):
+        self.points = numpy.asarray(points, dtype="d")
+        self.point_ids = numpy.asarray(point_ids, dtype=int)
+        self.weights = numpy.asarray(weights, dtype="d")
+        self.components = numpy.asarray(components, dtype=int)
+        if alphas is not None:
+            alphas = numpy.asarray(alphas, dtype=int)
+        self.alphas = alphas
+
+    def __len__(self):
+        return len(self.weights)
+
+    def to_dict(self):
+        """Returns the representation as a point dictionary, mapping
+        each point to a list of pairs (weight, component), or as a
+        derivative dictionary, mapping each point to a list of triples
+        (weight, multi-index, component)."""
+        pts = [tuple(pt) for pt in self.points.tolist()]
+        result = OrderedDict()
+        for k, j in enumerate(self.point_ids.tolist()):
+            w = self.weights[k]
+            c = tuple(i for i in self.components[k].tolist() if i >= 0)
+            if self.alphas is None:
+                term = (w, c)
+            else:
+                term = (w, tuple(self.alphas[k].tolist()), c)
+            result.setdefault(pts[j], []).append(term)
+        return result
+
+
+def functional_arrays(dct, derivatives=False):
+    """Converts a point dictionary, or a derivative dictionary if
+    derivatives is True, into a FunctionalArrays."""
+    points = list(dct.keys())
+    point_ids = []
+    weights = []
+    components = []
+    alphas = []
+    for j, pt in enumerate(points):
+        for term in dct[pt]:
+            if derivatives:
+                w, alpha, c = term
+                alphas.append(tuple(alpha))
+            else:
+                w, c = term
+            point_ids.append(j)
+            # Weights may come as one element arrays
+            weights.append(numpy.asarray(w, dtype="d").item())
+            components.append((c,) if numpy.isscalar(c) else tuple(c))
+
+    sd = len(points[0]) if points else 0
+    rank = max([len(c) for c in components] + [0])
+    comps = numpy.full((len(components), rank), -1, dtype=int)
+    for k, c in enumerate(components):
+        comps[k, :len(c)] = c
+    if derivatives:
+        alphas = numpy.reshape(numpy.array(alphas, dtype=int), (len(alphas), sd))
+    else:
+        alphas = None
+    return FunctionalArrays(numpy.reshape(numpy.array(points, "d"), (len(points), sd)),
+                            point_ids, weights, comps, alphas)
+
+
+def _component_rows(components, comp_rows):
+    """Returns the indices of the terms and of the rows of the
+    (flattened) value shape they contribute to, a term with a partial
+    component contributes to several rows."""
+    num_terms = len(components)
+    if components.shape[1] == comp_rows.ndim and numpy.all(components >= 0):
+        rows = comp_rows[tuple(components.T)]
+        return numpy.arange(num_terms), numpy.broadcast_to(rows, (num_terms,))
+    terms = []
+    rows = []
+    for t, c in enumerate(components):
+        c_rows = numpy.ravel(comp_rows[tuple(i for i in c if i >= 0)])
+        terms.extend([t] * len(c_rows))
+        rows.extend(c_rows)
+    return numpy.array(terms, dtype=int), numpy.array(rows, dtype=int)
+
+
+def functional_terms(functionals, shape, sd):
+    """Gathers the terms of all functionals, acting on functions of the
+    given value shape on a cell of dimension sd, in coordinate format.
+
+    Returns a tuple (points, alphas, rows, cols, alpha_ids, weights)
+    where points is the union of the points of the functionals and
+    alphas holds the distinct multi-indices (zero for point
+    evaluations).  Term t has weight weights[t], is evaluated at
+    points[cols[t]] with multi-index alphas[alpha_ids[t]], and
+    contributes to row rows[t] = k * num_comps + c for the k:th
+    functional and the flattened component c."""
+    num_comps = int(numpy.prod(shape))
+
+    # Rows of the (flattened) value shape of each component
+    comp_rows = numpy.reshape(numpy.arange(num_comps), shape)
+
+    points = [numpy.zeros((0, sd), "d")]
+    rows = [numpy.zeros(0, dtype=int)]
+    cols = [numpy.zeros(0, dtype=int)]
+    weights = [numpy.zeros(0, "d")]
+    alphas = [numpy.zeros((0, sd), dtype=int)]
+    num_points = 0
+    for k, ell in enumerate(functionals):
+        for data in (ell.point_arrays, ell.deriv_arrays):
+            if data is None or len(data) == 0:
+                continue
+            terms, term_rows = _component_rows(data.components, comp_rows)
+            points.append(data.points)
+            rows.append(k * num_comps + term_rows)
+            cols.append(num_points + data.point_ids[terms])
+            weights.append(data.weights[terms])
+            if data.alphas is None:
+                alphas.append(numpy.zeros((len(terms), sd), dtype=int))
+            else:
+                alphas.append(data.alphas[terms])
+            num_points += len(data.points)
+
+    points, inverse = numpy.unique(numpy.concatenate(points), axis=0,
+                                   return_inverse=True)
+    cols = numpy.ravel(inverse)[numpy.concatenate(cols)]
+    alphas, alpha_ids = numpy.unique(numpy.concatenate(alphas), axis=0,
+                                     return_inverse=True)
+    return (points, alphas, numpy.concatenate(rows), cols,
+            numpy.ravel(alpha_ids), numpy.concatenate(weights))
+
+
+def riesz_representation(functionals, poly_set):
+    """Returns the array representations of the functionals over the
+    base of the given polynomial set, stacked so that the result has
+    shape (len(functionals),) + poly_set.get_shape() + (num_exp,).
+
+    The functionals are represented through their point and derivative
+    arrays.  The expansion set (or its jet, if any functional takes
+    derivatives) is tabulated once at the union of all of their points,
+    and the weights are gathered into one matrix per multi-index that
+    is applied to the tabulation."""
+    es = poly_set.get_expansion_set()
+    ed = poly_set.get_embedded_degree()
+    sd = poly_set.get_reference_element().get_spatial_dimension()
+    shape = tuple(poly_set.get_shape())
+    num_exp = es.get_num_members(ed)
+    num_rows = len(functionals) * int(numpy.prod(shape))
+
+    pts, alphas, rows, cols, alpha_ids, weights = functional_terms(functionals, shape, sd)
+
+    result = numpy.zeros((num_rows, num_exp), "d")
+    if len(pts) > 0:
+        order = int(max(numpy.sum(alphas, axis=1)))
+        if order == 0:
+            jet = [es.tabulate(ed, pts)]
+        else:
+            jet = es.tabulate_jet(ed, pts, order)
+
+        for a, alpha in enumerate(alphas):
+            mask = alpha_ids == a
+            wts = numpy.zeros((num_rows, len(pts)), "d")
+            numpy.add.at(wts, (rows[mask], cols[mask]), weights[mask])
+            dvals = derivative_values(jet, tuple(alpha.tolist()))
+            result += numpy.dot(wts, dvals.T)
+
+    return numpy.reshape(result, (len(functionals),) + shape + (num_exp,))
+
+
 # also put in a "jet_dict" that maps
 # pt --> {wt, multiindex, comp}
 # the multiindex is an iterable of nonnegative
@@ -44,18 +237,35 @@ class Functional(object):
     argument evaluated at particular points."""
 
     def __init__(self, ref_el, target_shape, pt_dict, deriv_dict, functional_type):
+        """The point and derivative dictionaries may also be given as
+        FunctionalArrays, which is how they are stored."""
         self.ref_el = ref_el
         self.target_shape = target_shape
-        self.pt_dict = pt_dict
-        self.deriv_dict = deriv_dict
+        if not (pt_dict is None or isinstance(pt_dict, FunctionalArrays)):
+            pt_dict = functional_arrays(pt_dict)
+        if not (deriv_dict is None or isinstance(deriv_dict, FunctionalArrays)):
+            deriv_dict = functional_arrays(deriv_dict, derivatives=True)
+        self.point_arrays = pt_dict
+        self.deriv_arrays = deriv_dict
         self.functional_type = functional_type
-        if len(deriv_dict) > 0:
-            per_point = list(chain(*deriv_dict.values()))
-            alphas = [foo[1] for foo in per_point]
-            self.max_deriv_order = max([sum(foo) for foo in alphas])
+        if deriv_dict:
+            self.max_deriv_order = int(max(numpy.sum(deriv_dict.alphas, axis=1)))
         else:
             self.max_deriv_order = 0
 
+    @property
+    def pt_dict(self):
+        """The point dictionary, see get_point_dict."""
+        if self.point_arrays is not None:
+            return self.point_arrays.to_dict()
+
+    @property
+    def deriv_dict(self):
+        """The derivative dictionary, mapping each point to a list of
+        triples containing the weight, multi-index and component."""
+        if self.deriv_arrays is not None:
+            return self.deriv_arrays.to_dict()
+
     def evaluate(self, f):
         """Obsolete and broken functional evaluation.
 
@@ -74,6 +284,14 @@ class Functional(object):
         of pairs containing the weight and component."""
         return self.pt_dict
 
+    def get_point_arrays(self):
+        """Returns the FunctionalArrays holding the point evaluations."""
+        return self.point_arrays
+
+    def get_deriv_arrays(self):
+        """Returns the FunctionalArrays holding the point derivatives."""
+        return self.deriv_arrays
+
     def get_reference_element(self):
         """Returns the reference element."""
         return self.ref_el
@@ -88,33 +306,7 @@ class Functional(object):
         """Constructs an array representation of the functional over
         the base of the given polynomial_set so that f(phi) for any
         phi in poly_set is given by a dot product."""
-        es = poly_set.get_expansion_set()
-        ed = poly_set.get_embedded_degree()
-        pt_dict = self.get_point_dict()
-
-        pts = list(pt_dict.keys())
-
-        # bfs is matrix that is pdim rows by num_pts cols
-        # where pdim is the polynomial dimension
-
-        bfs = es.tabulate(ed, pts)
-
-        result = numpy.zeros(poly_set.coeffs.shape[1:], "d")
-
-        # loop over points
-        for j in range(len(pts)):
-            pt_cur = pts[j]
-            wc_list = pt_dict[pt_cur]
-
-            # loop over expansion functions
-            for i in range(bfs.shape[0]):
-                for (w, c) in wc_list:
-                    result[c][i] += w * bfs[i, j]
-
-        if self.deriv_dict:
-            raise NotImplementedError("Generic to_riesz implementation does not support derivatives")
-
-        return result
+        return riesz_representation([self], poly_set)[0]
 
     def tostr(self):
         return self.functional_type
@@ -180,27 +372,10 @@ class PointDerivative(Functional):
 
         return sympy.diff(fn(X), *dvars).evalf(subs=dict(zip(dX, x)))
 
-    def to_riesz(self, poly_set):
-        x = list(self.deriv_dict.keys())[0]
-
-        X = sympy.DeferredVector('x')
-        dx = numpy.asarray([X[i] for i in range(len(x))])
-
-        es = poly_set.get_expansion_set()
-        ed = poly_set.get_embedded_degree()
-
-        bfs = es.tabulate(ed, [dx])[:, 0]
-
-        # Expand the multi-index as a series of variables to
-        # differentiate with respect to.
-        dvars = tuple(d for d, a in zip(dx, self.alpha)
-                      for count in range(a))
-
-        return numpy.asarray([sympy.lambdify(X, sympy.diff(b, *dvars))(x)
-                              for b in bfs])
-
 
 class PointNormalDerivative(Functional):
+    """Class representing the derivative in the direction of the normal
+    of a facet at a particular point x."""
 
     def __init__(self, ref_el, facet_no, pt):
         n = ref_el.compute_normal(facet_no)
@@ -216,24 +391,6 @@ class PointNormalDerivative(Functional):
 
         Functional.__init__(self, ref_el, tuple(), {}, dpt_dict, "PointNormalDeriv")
 
-    def to_riesz(self, poly_set):
-        x = list(self.deriv_dict.keys())[0]
-
-        X = sympy.DeferredVector('x')
-        dx = numpy.asarray([X[i] for i in range(len(x))])
-
-        es = poly_set.get_expansion_set()
-        ed = poly_set.get_embedded_degree()
-
-        bfs = es.tabulate(ed, [dx])[:, 0]
-
-        # We need the gradient dotted with the normal.
-        return numpy.asarray(
-            [sympy.lambdify(
-                X, sum([sympy.diff(b, dxi)*ni
-                        for dxi, ni in zip(dx, self.n)]))(x)
-             for b in bfs])
-
 
 class IntegralMoment(Functional):
     """An IntegralMoment is a functional"""
@@ -256,38 +413,24 @@ class IntegralMoment(Functional):
               The shape ??? (Optional)
         """
         qpts, qwts = Q.get_points(), Q.get_weights()
-        pt_dict = OrderedDict()
         self.comp = comp
-        for i in range(len(qpts)):
-            pt_cur = tuple(qpts[i])
-            pt_dict[pt_cur] = [(qwts[i] * f_at_qpts[i], comp)]
-        Functional.__init__(self, ref_el, shp, pt_dict, {}, "IntegralMoment")
+        num_qpts = len(qpts)
+        pt_arrays = FunctionalArrays(qpts, numpy.arange(num_qpts),
+                                     qwts * numpy.asarray(f_at_qpts[:num_qpts]),
+                                     numpy.tile(numpy.asarray(comp, dtype=int),
+                                                (num_qpts, 1)))
+        Functional.__init__(self, ref_el, shp, pt_arrays, {}, "IntegralMoment")
 
     def __call__(self, fn):
         """Evaluate the functional on the function fn."""
-        pts = list(self.pt_dict.keys())
-        wts = numpy.array([foo[0][0] for foo in list(self.pt_dict.values())])
+        pts = [tuple(pt) for pt in self.point_arrays.points]
+        wts = self.point_arrays.weights
         result = numpy.dot([fn(p) for p in pts], wts)
 
         if self.comp:
             result = result[self.comp]
         return result
 
-    def to_riesz(self, poly_set):
-        es = poly_set.get_expansion_set()
-        ed = poly_set.get_embedded_degree()
-        pts = list(self.pt_dict.keys())
-        bfs = es.tabulate(ed, pts)
-        wts = numpy.array([foo[0][0] for foo in list(self.pt_dict.values())])
-        result = numpy.zeros(poly_set.coeffs.shape[1:], "d")
-
-        if len(self.comp) == 0:
-            result[:] = numpy.dot(bfs, wts)
-        else:
-            result[self.comp, :] = numpy.dot(bfs, wts)
-
-        return result
-
 
 class IntegralMomentOfNormalDerivative(Functional):
     """Functional giving normal derivative integrated against some function on a facet."""
@@ -306,42 +449,18 @@ class IntegralMomentOfNormalDerivative(Functional):
         qpts, qwts = Q.get_points(), Q.get_weights()
         dpts = [fmap(pt) for pt in qpts]
         self.dpts = dpts
+        # One value per quadrature point, also if given as a column
+        f_at_qpts = numpy.ravel(f_at_qpts)
 
         dpt_dict = OrderedDict()
 
         alphas = [[1 if j == i else 0 for j in range(sd)] for i in range(sd)]
         for j, pt in enumerate(dpts):
-            dpt_dict[tuple(pt)] = [(qwts[j]*n[i], alphas[i], tuple()) for i in range(sd)]
+            dpt_dict[tuple(pt)] = [(qwts[j]*f_at_qpts[j]*n[i], alphas[i], tuple()) for i in range(sd)]
 
         Functional.__init__(self, ref_el, tuple(),
                             {}, dpt_dict, "IntegralMomentOfNormalDerivative")
 
-    def to_riesz(self, poly_set):
-        es = poly_set.get_expansion_set()
-        ed = poly_set.get_embedded_degree()
-
-        result = numpy.zeros(es.get_num_members(ed))
-        sd = self.ref_el.get_spatial_dimension()
-
-        X = sympy.DeferredVector('x')
-        dX = numpy.asarray([X[i] for i in range(sd)])
-
-        # evaluate bfs symbolically
-        bfs = es.tabulate(ed, [dX])[:, 0]
-
-        n = self.n
-        qwts = self.Q.get_weights()
-
-        for i in range(len(result)):
-            thing = sympy.lambdify(
-                X, sum([sympy.diff(bfs[i], dxi)*ni
-                        for dxi, ni in zip(dX, n)]))
-
-            for j, pt in enumerate(self.deriv_dict.keys()):
-                result[i] += qwts[j] * self.f_at_qpts[j] * thing(pt)
-
-        return result
-
 
 class FrobeniusIntegralMoment(Functional):
 
@@ -354,13 +473,14 @@ class FrobeniusIntegralMoment(Functional):
         shp = (f_at_qpts.shape[0],)
 
         qpts, qwts = Q.get_points(), Q.get_weights()
-        pt_dict = {}
-        for i in range(len(qpts)):
-            pt_cur = tuple(qpts[i])
-            pt_dict[pt_cur] = [(qwts[i] * f_at_qpts[j, i], (j,))
-                               for j in range(f_at_qpts.shape[0])]
+        num_qpts, num_comps = len(qpts), shp[0]
+        # Terms ordered by point, then by component
+        pt_arrays = FunctionalArrays(qpts,
+                                     numpy.repeat(numpy.arange(num_qpts), num_comps),
+                                     numpy.ravel((f_at_qpts * qwts).T),
+                                     numpy.tile(numpy.arange(num_comps), num_qpts)[:, None])
 
-        Functional.__init__(self, ref_el, shp, pt_dict, {}, "FrobeniusIntegralMoment")
+        Functional.__init__(self, ref_el, shp, pt_arrays, {}, "FrobeniusIntegralMoment")
 
 
 # point normals happen on a d-1 dimensional facet
@@ -396,12 +516,6 @@ class PointEdgeTangentEvaluation(Functional):
         x = list(map(str, list(self.pt_dict.keys())[0]))
         return "(u.t)(%s)" % (','.join(x),)
 
-    def to_riesz(self, poly_set):
-        # should be singleton
-        xs = list(self.pt_dict.keys())
-        phis = poly_set.get_expansion_set().tabulate(poly_set.get_embedded_degree(), xs)
-        return numpy.outer(self.t, phis)
-
 
 class PointFaceTangentEvaluation(Functional):
     """Implements the evaluation of a tangential component of a
@@ -420,11 +534,6 @@ class PointFaceTangentEvaluation(Functional):
         x = list(map(str, list(self.pt_dict.keys())[0]))
         return "(u.t%d)(%s)" % (self.tno, ','.join(x),)
 
-    def to_riesz(self, poly_set):
-        xs = list(self.pt_dict.keys())
-        phis = poly_set.get_expansion_set().tabulate(poly_set.get_embedded_degree(), xs)
-        return numpy.outer(self.t, phis)
-
 
 class PointScaledNormalEvaluation(Functional):
     """Implements the evaluation of the normal component of a vector at a
@@ -443,11 +552,6 @@ class PointScaledNormalEvaluation(Functional):
         x = list(map(str, list(self.pt_dict.keys())[0]))
         return "(u.n)(%s)" % (','.join(x),)
 
-    def to_riesz(self, poly_set):
-        xs = list(self.pt_dict.keys())
-        phis = poly_set.get_expansion_set().tabulate(poly_set.get_embedded_degree(), xs)
-        return numpy.outer(self.n, phis)
-
 
 class PointwiseInnerProductEvaluation(Functional):
     """
@@ -6,6 +6,7 @@
 
 import numpy
 import types
+from FIAT.finite_element import FiniteElement
 from FIAT.tensor_product import TensorProductElement
 from FIAT import functional
 
@@ -116,6 +117,7 @@ def Hdiv(element):
         return new_result
 
     newelement.tabulate = types.MethodType(tabulate, newelement)
+    newelement.tabulate_all_entities = types.MethodType(FiniteElement.tabulate_all_entities, newelement)
 
     # splat any PointEvaluation functionals.
     # they become a nasty mix of internal and external component DOFs
@@ -238,6 +240,7 @@ def Hcurl(element):
         return new_result
 
     newelement.tabulate = types.MethodType(tabulate, newelement)
+    newelement.tabulate_all_entities = types.MethodType(FiniteElement.tabulate_all_entities, newelement)
 
     # splat any PointEvaluation functionals.
     # they become a nasty mix of internal and external component DOFs
@@ -89,6 +89,38 @@ class MixedElement(FiniteElement):
 
         return output
 
+    def tabulate_all_entities(self, order, points, dim):
+        """Tabulate a mixed element on every entity of dimension dim by
+        splatting together the tabulations of the individual elements.
+        """
+        num_entities = len(self.ref_el.get_topology()[dim])
+        shape = (num_entities, self.space_dimension()) + self.value_shape() + (len(points),)
+
+        output = {}
+
+        sub_dims = [0] + list(e.space_dimension() for e in self.elements())
+        sub_cmps = [0] + list(numpy.prod(e.value_shape(), dtype=int)
+                              for e in self.elements())
+        irange = numpy.cumsum(sub_dims)
+        crange = numpy.cumsum(sub_cmps)
+
+        for i, e in enumerate(self.elements()):
+            table = e.tabulate_all_entities(order, points, dim)
+
+            for d, tab in table.items():
+                try:
+                    arr = output[d]
+                except KeyError:
+                    arr = numpy.zeros(shape, dtype=tab.dtype)
+                    output[d] = arr
+
+                ir = irange[i:i+2]
+                cr = crange[i:i+2]
+                tab = tab.reshape(num_entities, ir[1] - ir[0], cr[1] - cr[0], -1)
+                arr[:, slice(*ir), slice(*cr)] = tab
+
+        return output
+
     def is_nodal(self):
         """True if primal and dual bases are orthogonal."""
         return all(e.is_nodal() for e in self._elements)
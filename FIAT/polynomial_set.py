@@ -15,9 +15,14 @@
 # we have an interface for defining sets of functionals (moments against
 # an entire set of polynomials)
 
+import numbers
+from collections.abc import Mapping
+from functools import lru_cache, partial
+
 import numpy
-from FIAT import expansions
+from FIAT import expansions, reference_element
 from FIAT.functional import index_iterator
+from FIAT.quadrature import QuadratureRule, make_quadrature
 
 
 def mis(m, n):
@@ -32,6 +37,54 @@ def mis(m, n):
                 for foo in mis(m - 1, i)]
 
 
+@lru_cache(maxsize=None)
+def derivative_multi_indices(m, n):
+    """Returns all m-tuples of nonnegative integers that sum up to at
+    most n, ordered by their sum.  This is the order of the derivatives
+    in tabulations as arrays.  The table is computed once per (m, n)."""
+    return tuple(alpha for i in range(n + 1) for alpha in mis(m, i))
+
+
+def derivative_indices(m, order):
+    """Returns the m-tuples of the derivatives selected by order, which
+    is either a maximum order (see derivative_multi_indices) or a
+    collection of multi-indices."""
+    if isinstance(order, numbers.Integral):
+        return derivative_multi_indices(m, order)
+    return tuple(tuple(alpha) for alpha in order)
+
+
+class LazyTabulation(Mapping):
+    """A read-only mapping from multi-indices to tabulated derivatives,
+    which computes each table by calling tabulate(alpha) when it is
+    first looked up."""
+
+    def __init__(self, alphas, tabulate):
+        self.alphas = tuple(alphas)
+        self._tabulate = tabulate
+        self._tables = {}
+
+    def __getitem__(self, alpha):
+        alpha = tuple(alpha)
+        try:
+            return self._tables[alpha]
+        except KeyError:
+            if alpha not in self.alphas:
+                raise
+        table = self._tabulate(alpha)
+        self._tables[alpha] = table
+        return table
+
+    def __contains__(self, alpha):
+        return tuple(alpha) in self.alphas
+
+    def __iter__(self):
+        return iter(self.alphas)
+
+    def __len__(self):
+        return len(self.alphas)
+
+
 # We order coeffs by C_{i,j,k}
 # where i is the index into the polynomial set,
 # j may be an empty tuple (scalar polynomials)
@@ -52,34 +105,142 @@ class PolynomialSet(object):
          the label of the expansion function, and j is a (possibly
          empty) tuple giving the index for a vector- or tensor-valued
          function.
+    factors: An optional pair (components, scalar_coeffs) such that
+         coeffs[i,j,k] = components[i,j] * scalar_coeffs[i,k], for
+         vector- and tensor-valued sets where each member is a scalar
+         polynomial times a constant tensor.  If given, coeffs may be
+         None, in which case it is only formed when requested and
+         tabulation works on the scalar coefficients.
     """
 
     def __init__(self, ref_el, degree, embedded_degree, expansion_set, coeffs,
-                 dmats):
+                 dmats, factors=None):
+        if coeffs is None and factors is None:
+            raise ValueError("Need either coeffs or factors")
         self.ref_el = ref_el
-        self.num_members = coeffs.shape[0]
         self.degree = degree
         self.embedded_degree = embedded_degree
         self.expansion_set = expansion_set
-        self.coeffs = coeffs
+        self._coeffs = coeffs
+        self.factors = factors
+        if factors is None:
+            self.num_members = coeffs.shape[0]
+        else:
+            self.num_members = factors[1].shape[0]
         self.dmats = dmats
+        # Cache of derivative coefficients, filled in on demand
+        self._derivative_coeffs = {}
+
+    @property
+    def coeffs(self):
+        if self._coeffs is None:
+            self._coeffs = _readonly(_expand_factors(*self.factors))
+        return self._coeffs
+
+    @coeffs.setter
+    def coeffs(self, coeffs):
+        self._coeffs = coeffs
+        self.factors = None
+        self.num_members = coeffs.shape[0]
+        self._derivative_coeffs = {}
 
     def tabulate_new(self, pts):
         return numpy.dot(self.coeffs,
                          self.expansion_set.tabulate(self.embedded_degree, pts))
 
     def tabulate(self, pts, jet_order=0):
-        """Returns the values of the polynomial set."""
-        result = {}
+        """Returns the values of the polynomial set.  jet_order is the
+        maximum derivative order or a collection of multi-indices, in
+        which case only those derivatives are tabulated."""
+        alphas = derivative_indices(self.ref_el.get_spatial_dimension(), jet_order)
+        return dict(zip(alphas, self.tabulate_array(pts, jet_order)))
+
+    def tabulate_array(self, pts, jet_order=0, out=None):
+        """Returns the values of the polynomial set and its derivatives
+        as one array A[k, i, ..., j], the derivative
+        derivative_indices(sd, jet_order)[k] of the i:th member at the
+        j:th point.  The result is written to out if given."""
+        alphas = derivative_indices(self.ref_el.get_spatial_dimension(), jet_order)
+        contract, point_shape, dtype = self._expansion_contraction(pts)
+        shape = (len(alphas), self.get_num_members()) + self.get_shape() + point_shape
+        if out is None:
+            out = numpy.empty(shape, dtype=numpy.result_type(dtype, self._get_stored_derivative_coeffs(alphas[0])))
+        elif out.shape != shape:
+            raise ValueError("Expected an output array of shape %s, not %s" % (shape, out.shape))
+        for k, alpha in enumerate(alphas):
+            out[k] = self._tabulate_derivative(contract, alpha)
+        return out
+
+    def tabulate_lazy(self, pts, jet_order=0):
+        """Returns the values of the polynomial set as a mapping like
+        tabulate, but each derivative is only computed when it is first
+        looked up."""
+        alphas = derivative_indices(self.ref_el.get_spatial_dimension(), jet_order)
+        contract, _, _ = self._expansion_contraction(pts)
+        return LazyTabulation(alphas, partial(self._tabulate_derivative, contract))
+
+    def _expansion_contraction(self, pts):
+        """Returns a function contracting expansion coefficients
+        c[..., i] with the members of the expansion set at pts, and the
+        shape of the point axes and the type of the values.  pts may be
+        a quadrature rule; collapsed rules on the reference element are
+        contracted by sum factorisation without tabulating the
+        expansion set."""
+        if isinstance(pts, QuadratureRule):
+            collapsed = getattr(pts, "get_collapsed_points", None)
+            if (collapsed is not None and hasattr(self.expansion_set, "tabulate_collapsed") and
+                    pts.ref_el.get_vertices() == self.expansion_set.ref_el.get_vertices()):
+                factors = self.expansion_set.tabulate_collapsed(self.embedded_degree, collapsed())
+                return (partial(self.expansion_set.contract_collapsed, self.embedded_degree, factors=factors),
+                        (len(pts.get_weights()),), numpy.dtype(float))
+            pts = pts.get_points()
         base_vals = self.expansion_set.tabulate(self.embedded_degree, pts)
-        for i in range(jet_order + 1):
-            alphas = mis(self.ref_el.get_spatial_dimension(), i)
-            for alpha in alphas:
-                D = form_matrix_product(self.dmats, alpha)
-                result[alpha] = numpy.dot(self.coeffs,
-                                          numpy.dot(numpy.transpose(D),
-                                                    base_vals))
-        return result
+        return (lambda coeffs: numpy.dot(coeffs, base_vals),
+                numpy.shape(base_vals)[1:], numpy.result_type(base_vals))
+
+    def _tabulate_derivative(self, contract, alpha):
+        """Returns the derivative alpha of the members of the set, where
+        contract contracts coefficients with the expansion set at the
+        points, see _expansion_contraction."""
+        vals = contract(self._get_stored_derivative_coeffs(alpha))
+        if self.factors is not None:
+            # Only the scalar part is tabulated, the constant
+            # tensors are multiplied in afterwards.
+            vals = _expand_factors(self.factors[0], vals)
+        return vals
+
+    def _get_stored_derivative_coeffs(self, alpha):
+        """Returns the derivative given by the multi-index alpha of the
+        stored coefficients, that is, of the scalar coefficients if the
+        set is factored and of coeffs otherwise.  These are computed
+        once and then cached."""
+        alpha = tuple(alpha)
+        try:
+            return self._derivative_coeffs[alpha]
+        except KeyError:
+            pass
+        if self.factors is None:
+            stored = self._coeffs
+        else:
+            stored = self.factors[1]
+        if sum(alpha) == 0:
+            dcoeffs = stored
+        else:
+            D = form_matrix_product(self.dmats, alpha)
+            dcoeffs = numpy.dot(stored, numpy.transpose(D))
+        self._derivative_coeffs[alpha] = dcoeffs
+        return dcoeffs
+
+    def get_derivative_coeffs(self, alpha):
+        """Returns the expansion coefficients of the derivative given by
+        the multi-index alpha of each member of the set, ordered like
+        coeffs."""
+        if sum(alpha) == 0:
+            return self.coeffs
+        dcoeffs = self._get_stored_derivative_coeffs(alpha)
+        if self.factors is not None:
+            dcoeffs = _expand_factors(self.factors[0], dcoeffs)
+        return dcoeffs
 
     def get_expansion_set(self):
         return self.expansion_set
@@ -87,6 +248,11 @@ class PolynomialSet(object):
     def get_coeffs(self):
         return self.coeffs
 
+    def get_factors(self):
+        """Returns the pair (components, scalar_coeffs) if the set is
+        factored and None otherwise."""
+        return self.factors
+
     def get_num_members(self):
         return self.num_members
 
@@ -105,70 +271,106 @@ class PolynomialSet(object):
     def get_shape(self):
         """Returns the shape of phi(x), where () corresponds to
         scalar (2,) a vector of length 2, etc"""
+        if self.factors is not None:
+            return self.factors[0].shape[1:]
         return self.coeffs.shape[1:-1]
 
     def take(self, items):
         """Extracts subset of polynomials given by items."""
+        if self.factors is not None:
+            factors = tuple(numpy.take(f, items, 0) for f in self.factors)
+            return PolynomialSet(self.ref_el, self.degree,
+                                 self.embedded_degree, self.expansion_set,
+                                 None, self.dmats, factors=factors)
         new_coeffs = numpy.take(self.get_coeffs(), items, 0)
         return PolynomialSet(self.ref_el, self.degree, self.embedded_degree,
                              self.expansion_set, new_coeffs, self.dmats)
 
 
+def _expand_factors(components, scalar_coeffs):
+    """Returns the dense coefficients of a factored polynomial set, or
+    the values if scalar_coeffs holds values of the scalar parts."""
+    num_members = scalar_coeffs.shape[0]
+    comps = numpy.reshape(components, (num_members, -1, 1))
+    coeffs = comps * scalar_coeffs[:, None, :]
+    return numpy.reshape(coeffs, components.shape + scalar_coeffs.shape[1:])
+
+
 class ONPolynomialSet(PolynomialSet):
     """Constructs an orthonormal basis out of expansion set by having an
     identity matrix of coefficients.  Can be used to specify ON bases
-    for vector- and tensor-valued sets as well.
+    for vector- and tensor-valued sets as well, which are stored in
+    factored form.
 
+    The expansion set, coefficients and dmats are shared between all
+    sets with the same reference element, degree and shape, and the
+    arrays are read-only.
     """
 
     def __init__(self, ref_el, degree, shape=tuple()):
-
-        if shape == tuple():
-            num_components = 1
-        else:
-            flat_shape = numpy.ravel(shape)
-            num_components = numpy.prod(flat_shape)
-        num_exp_functions = expansions.polynomial_dimension(ref_el, degree)
-        num_members = num_components * num_exp_functions
-        embedded_degree = degree
         expansion_set = expansions.get_expansion_set(ref_el)
-        sd = ref_el.get_spatial_dimension()
-
-        # set up coefficients
-        coeffs_shape = tuple([num_members] + list(shape) + [num_exp_functions])
-        coeffs = numpy.zeros(coeffs_shape, "d")
-
-        # use functional's index_iterator function
-        cur_bf = 0
+        dmats = _on_dmats(ref_el, degree)
+        num_exp_functions = expansions.polynomial_dimension(ref_el, degree)
 
+        shape = tuple(shape)
         if shape == tuple():
-            coeffs = numpy.eye(num_members)
-        else:
-            for idx in index_iterator(shape):
-                n = expansions.polynomial_dimension(ref_el, embedded_degree)
-                for exp_bf in range(n):
-                    cur_idx = tuple([cur_bf] + list(idx) + [exp_bf])
-                    coeffs[cur_idx] = 1.0
-                    cur_bf += 1
-
-        # construct dmats
-        if degree == 0:
-            dmats = [numpy.array([[0.0]], "d") for i in range(sd)]
+            coeffs = _on_coeffs(num_exp_functions)
+            factors = None
         else:
-            pts = ref_el.make_points(sd, 0, degree + sd + 1)
-
-            v = numpy.transpose(expansion_set.tabulate(degree, pts))
-            vinv = numpy.linalg.inv(v)
-
-            dv = expansion_set.tabulate_derivatives(degree, pts)
-            dtildes = [[[a[1][i] for a in dvrow] for dvrow in dv]
-                       for i in range(sd)]
-
-            dmats = [numpy.dot(vinv, numpy.transpose(dtilde))
-                     for dtilde in dtildes]
-
-        PolynomialSet.__init__(self, ref_el, degree, embedded_degree,
-                               expansion_set, coeffs, dmats)
+            coeffs = None
+            factors = _on_factors(num_exp_functions, shape)
+        PolynomialSet.__init__(self, ref_el, degree, degree,
+                               expansion_set, coeffs, list(dmats),
+                               factors=factors)
+
+
+def _readonly(array):
+    array.flags.writeable = False
+    return array
+
+
+@lru_cache(maxsize=128)
+def _on_coeffs(num_exp_functions):
+    """Returns the (read-only) coefficients of a scalar orthonormal
+    basis with num_exp_functions members, see ONPolynomialSet."""
+    return _readonly(numpy.eye(num_exp_functions))
+
+
+@lru_cache(maxsize=128)
+def _on_factors(num_exp_functions, shape, symmetric=False):
+    """Returns the (read-only) factors of an orthonormal basis of the
+    given tensor shape, see ONPolynomialSet and
+    ONSymTensorPolynomialSet.  Each member is one of the
+    num_exp_functions members of the scalar basis times a unit tensor,
+    or a symmetrised unit tensor if symmetric is True."""
+    units = []
+    for idx in index_iterator(shape):
+        if symmetric and idx[0] > idx[1]:
+            continue
+        unit = numpy.zeros(shape, "d")
+        unit[tuple(idx)] = 1.0
+        if symmetric:
+            unit[tuple(reversed(idx))] = 1.0
+        units.append(unit)
+    num_components = len(units)
+
+    components = numpy.repeat(numpy.array(units), num_exp_functions, axis=0)
+    scalar_coeffs = numpy.tile(numpy.eye(num_exp_functions),
+                               (num_components, 1))
+    return _readonly(components), _readonly(scalar_coeffs)
+
+
+def _on_dmats(ref_el, degree):
+    """Returns a tuple of the (read-only) dmats of the expansion set on
+    ref_el of the given degree, see form_dmats."""
+    return _cached_dmats(reference_element.geometric_key(ref_el), ref_el, degree)
+
+
+@lru_cache(maxsize=128)
+def _cached_dmats(key, ref_el, degree):
+    expansion_set = expansions.get_expansion_set(ref_el)
+    return tuple(_readonly(dmat)
+                 for dmat in form_dmats(ref_el, expansion_set, degree))
 
 
 def project(f, U, Q):
@@ -185,6 +387,44 @@ def project(f, U, Q):
     return coeffs
 
 
+def form_dmats(ref_el, expansion_set, degree):
+    """Returns the matrices dmats such that column j of dmats[i] holds
+    the expansion coefficients of the derivative in direction i of the
+    j:th member of expansion_set of the given degree.
+
+    The derivatives are projected onto the (orthogonal) expansion set
+    using a quadrature rule that integrates the products exactly, which
+    avoids inverting a Vandermonde matrix on a lattice.  Expansion
+    sets that know their dmats (through get_dmats) are asked directly.
+    """
+    if hasattr(expansion_set, "get_dmats"):
+        return expansion_set.get_dmats(degree)
+    sd = ref_el.get_spatial_dimension()
+    num_members = expansion_set.get_num_members(degree)
+    dmats = [numpy.zeros((num_members, num_members), "d") for i in range(sd)]
+    if degree == 0:
+        return dmats
+
+    # The derivative of a member of degree k has degree k - 1, so we only
+    # project onto the members of lower degree and need to integrate
+    # products of degree 2 * degree - 2 exactly.
+    Q = make_quadrature(ref_el, degree)
+    pts, wts = Q.get_points(), Q.get_weights()
+
+    jet = expansion_set.tabulate_jet(degree, pts, 1)
+    v = numpy.asarray(jet[0])
+    dv = numpy.reshape(jet[1], (num_members, len(pts), sd))
+
+    wv = v * wts
+    mass = numpy.sum(wv * v, axis=1)
+    for k in range(1, degree + 1):
+        rows = expansion_set.get_num_members(k - 1)
+        cols = slice(rows, expansion_set.get_num_members(k))
+        for i in range(sd):
+            dmats[i][:rows, cols] = numpy.dot(wv[:rows], dv[cols, :, i].T) / mass[:rows, None]
+    return dmats
+
+
 def form_matrix_product(mats, alpha):
     """Forms product over mats[i]**alpha[i]"""
     m = mats[0].shape[0]
@@ -238,39 +478,11 @@ class ONSymTensorPolynomialSet(PolynomialSet):
         if size is None:
             size = sd
 
-        shape = (size, size)
-        num_exp_functions = expansions.polynomial_dimension(ref_el, degree)
-        num_components = size * (size + 1) // 2
-        num_members = num_components * num_exp_functions
-        embedded_degree = degree
         expansion_set = expansions.get_expansion_set(ref_el)
-
-        # set up coefficients for symmetric tensors
-        coeffs_shape = tuple([num_members] + list(shape) + [num_exp_functions])
-        coeffs = numpy.zeros(coeffs_shape, "d")
-        cur_bf = 0
-        for [i, j] in index_iterator(shape):
-            n = expansions.polynomial_dimension(ref_el, embedded_degree)
-            if i == j:
-                for exp_bf in range(n):
-                    cur_idx = tuple([cur_bf] + [i, j] + [exp_bf])
-                    coeffs[cur_idx] = 1.0
-                    cur_bf += 1
-            elif i < j:
-                for exp_bf in range(n):
-                    cur_idx = tuple([cur_bf] + [i, j] + [exp_bf])
-                    coeffs[cur_idx] = 1.0
-                    cur_idx = tuple([cur_bf] + [j, i] + [exp_bf])
-                    coeffs[cur_idx] = 1.0
-                    cur_bf += 1
-
+        num_exp_functions = expansions.polynomial_dimension(ref_el, degree)
+        factors = _on_factors(num_exp_functions, (size, size), symmetric=True)
         # construct dmats. this is the same as ONPolynomialSet.
-        pts = ref_el.make_points(sd, 0, degree + sd + 1)
-        v = numpy.transpose(expansion_set.tabulate(degree, pts))
-        vinv = numpy.linalg.inv(v)
-        dv = expansion_set.tabulate_derivatives(degree, pts)
-        dtildes = [[[a[1][i] for a in dvrow] for dvrow in dv]
-                   for i in range(sd)]
-        dmats = [numpy.dot(vinv, numpy.transpose(dtilde)) for dtilde in dtildes]
-        PolynomialSet.__init__(self, ref_el, degree, embedded_degree,
-                               expansion_set, coeffs, dmats)
+        dmats = _on_dmats(ref_el, degree)
+        PolynomialSet.__init__(self, ref_el, degree, degree,
+                               expansion_set, None, list(dmats),
+                               factors=factors)
@@ -0,0 +1,103 @@
+# Copyright (C) 2019 Imperial College London and others
+#
+# This file is part of FIAT (https://www.fenicsproject.org)
+#
+# SPDX-License-Identifier:    LGPL-3.0-or-later
+"""Evaluation of basis functions on batches of affinely mapped cells.
+
+The Jacobians J of the maps x = J X + b from the reference cell to the
+cells are given as an array of shape (ncells, gdim, tdim).  For
+manifolds (gdim > tdim) the pseudo-determinant and pseudo-inverse of J
+are used."""
+
+import numpy
+
+from FIAT.polynomial_set import derivative_multi_indices
+
+
+def jacobian_determinants(J):
+    """Returns the (pseudo-)determinants of a batch of Jacobians."""
+    J = numpy.asarray(J)
+    if J.shape[1] == J.shape[2]:
+        return numpy.linalg.det(J)
+    return numpy.sqrt(numpy.linalg.det(numpy.einsum("cki,ckj->cij", J, J)))
+
+
+def jacobian_inverses(J):
+    """Returns the (pseudo-)inverses K of a batch of Jacobians, of shape
+    (ncells, tdim, gdim)."""
+    J = numpy.asarray(J)
+    if J.shape[1] == J.shape[2]:
+        return numpy.linalg.inv(J)
+    return numpy.linalg.pinv(J)
+
+
+def push_forward(mapping, values, J, detJ=None, K=None):
+    """Maps reference values to every cell of a batch.
+
+    :arg mapping: a mapping string, as returned by FiniteElement.mapping.
+    :arg values: reference values of shape (nbf,) + value_shape + extra,
+                 where extra are any trailing axes (such as points).
+    :arg J: Jacobians of shape (ncells, gdim, tdim).
+    :arg detJ: optional determinants of J, see jacobian_determinants.
+    :arg K: optional inverses of J, see jacobian_inverses.
+
+    :returns: an array of shape (ncells, nbf) + physical value_shape +
+              extra.  For the affine mapping this is a read-only view
+              of values.
+    """
+    J = numpy.asarray(J)
+    values = numpy.asarray(values)
+    if mapping == "affine":
+        return numpy.broadcast_to(values, (len(J),) + values.shape)
+    elif mapping in ("contravariant piola", "double contravariant piola"):
+        if detJ is None:
+            detJ = jacobian_determinants(J)
+        if mapping == "contravariant piola":
+            result = numpy.einsum("cij,bj...->cbi...", J, values)
+            scale = detJ
+        else:
+            result = numpy.einsum("cik,bkl...,cjl->cbij...", J, values, J)
+            scale = detJ**2
+        return result / numpy.reshape(scale, (-1,) + (1,) * (result.ndim - 1))
+    elif mapping in ("covariant piola", "double covariant piola"):
+        if K is None:
+            K = jacobian_inverses(J)
+        if mapping == "covariant piola":
+            return numpy.einsum("cji,bj...->cbi...", K, values)
+        return numpy.einsum("cki,bkl...,clj->cbij...", K, values, K)
+    raise ValueError("Unknown mapping %s" % mapping)
+
+
+def physical_tabulate(element, table, J):
+    """Returns the values and gradients of the basis functions of an
+    element on every cell of a batch.
+
+    :arg element: the element.
+    :arg table: the reference tabulation of the element, as returned by
+                element.tabulate_array(order, points) with order 0 or 1.
+    :arg J: Jacobians of shape (ncells, gdim, tdim).
+
+    :returns: a pair (values, gradients) of arrays of shape
+              (ncells, nbf) + physical value_shape + (npts,) and
+              (ncells, nbf) + physical value_shape + (gdim, npts).  The
+              gradients are None if table holds no first derivatives.
+    """
+    mappings = set(element.mapping())
+    if len(mappings) != 1:
+        raise NotImplementedError("Elements with several mappings should be pushed forward by sub-element")
+    mapping, = mappings
+    J = numpy.asarray(J)
+    tdim = element.get_reference_element().get_spatial_dimension()
+    detJ = jacobian_determinants(J)
+    K = jacobian_inverses(J)
+
+    values = push_forward(mapping, table[0], J, detJ, K)
+    if len(table) < len(derivative_multi_indices(tdim, 1)):
+        return values, None
+
+    # Push forward the reference gradient with the derivative direction
+    # as an extra axis, then apply the chain rule
+    ref_grad = numpy.moveaxis(table[1:tdim + 1], 0, -2)
+    grad = push_forward(mapping, ref_grad, J, detJ, K)
+    return values, numpy.einsum("cmk,c...mp->c...kp", K, grad)
@@ -7,7 +7,6 @@
 # Modified by Marie E. Rognes (meg@simula.no), 2012
 # Modified by David A. Ham (david.ham@imperial.ac.uk), 2015
 
-import itertools
 import math
 import numpy
 
@@ -126,7 +125,8 @@ class GaussLegendreQuadratureLineRule(QuadratureRule):
 class CollapsedQuadratureTriangleRule(QuadratureRule):
     """Implements the collapsed quadrature rules defined in
     Karniadakis & Sherwin by mapping products of Gauss-Jacobi rules
-    from the square to the triangle."""
+    from the square to the triangle.  The Gauss-Jacobi points on the
+    square are kept, see get_collapsed_points."""
 
     def __init__(self, ref_el, m):
         ptx, wx = compute_gauss_jacobi_rule(0., 0., m)
@@ -148,12 +148,19 @@ class CollapsedQuadratureTriangleRule(QuadratureRule):
         wts = [0.5 * scale * w1 * w2 for w1 in wx for w2 in wy]
 
         QuadratureRule.__init__(self, ref_el, tuple(pts), tuple(wts))
+        self.collapsed_points = (numpy.array(ptx), numpy.array(pty))
+
+    def get_collapsed_points(self):
+        """Returns the coordinates on [-1, 1] of the points of the
+        rule in each direction of the square."""
+        return self.collapsed_points
 
 
 class CollapsedQuadratureTetrahedronRule(QuadratureRule):
     """Implements the collapsed quadrature rules defined in
     Karniadakis & Sherwin by mapping products of Gauss-Jacobi rules
-    from the cube to the tetrahedron."""
+    from the cube to the tetrahedron.  The Gauss-Jacobi points on the
+    cube are kept, see get_collapsed_points."""
 
     def __init__(self, ref_el, m):
         ptx, wx = compute_gauss_jacobi_rule(0., 0., m)
@@ -177,6 +184,12 @@ class CollapsedQuadratureTetrahedronRule(QuadratureRule):
                for w1 in wx for w2 in wy for w3 in wz]
 
         QuadratureRule.__init__(self, ref_el, tuple(pts), tuple(wts))
+        self.collapsed_points = (numpy.array(ptx), numpy.array(pty), numpy.array(ptz))
+
+    def get_collapsed_points(self):
+        """Returns the coordinates on [-1, 1] of the points of the
+        rule in each direction of the cube."""
+        return self.collapsed_points
 
 
 class UFCTetrahedronFaceQuadratureRule(QuadratureRule):
@@ -251,17 +264,55 @@ def make_quadrature(ref_el, m):
         raise ValueError("Unable to make quadrature for cell: %s" % ref_el)
 
 
+class TensorProductQuadratureRule(QuadratureRule):
+    """Quadrature rule on a TensorProduct cell that is the product of
+    quadrature rules on the component cells.  The points (with the
+    coordinates of the components concatenated, and the points of the
+    last component running fastest) and weights are only formed when
+    they are first used."""
+
+    def __init__(self, *factors):
+        self.ref_el = reference_element.TensorProductCell(*[q.ref_el
+                                                            for q in factors])
+        self.factors = tuple(factors)
+        self._pts = None
+        self._wts = None
+
+    def get_factors(self):
+        """Returns the quadrature rules of the components."""
+        return self.factors
+
+    @property
+    def pts(self):
+        if self._pts is None:
+            factor_pts = [numpy.reshape(q.get_points(), (len(q.get_weights()), -1))
+                          for q in self.factors]
+            shape = tuple(len(x) for x in factor_pts)
+            pts = numpy.empty(shape + (sum(x.shape[1] for x in factor_pts),))
+            start = 0
+            for i, x in enumerate(factor_pts):
+                # Broadcast the coordinates of the i:th component
+                index = [None] * len(shape) + [slice(None)]
+                index[i] = slice(None)
+                pts[..., start:start + x.shape[1]] = x[tuple(index)]
+                start += x.shape[1]
+            self._pts = numpy.reshape(pts, (-1, pts.shape[-1]))
+        return self._pts
+
+    @property
+    def wts(self):
+        if self._wts is None:
+            wts = numpy.ones(())
+            for q in self.factors:
+                wts = numpy.multiply.outer(wts, q.get_weights())
+            self._wts = numpy.reshape(wts, (-1,))
+        return self._wts
+
+
 def make_tensor_product_quadrature(*quad_rules):
     """Returns the quadrature rule for a TensorProduct cell, by combining
     the quadrature rules of the components."""
-    ref_el = reference_element.TensorProductCell(*[q.ref_el
-                                                   for q in quad_rules])
-    # Coordinates are "concatenated", weights are multiplied
-    pts = [list(itertools.chain(*pt_tuple))
-           for pt_tuple in itertools.product(*[q.pts for q in quad_rules])]
-    wts = [numpy.prod(wt_tuple)
-           for wt_tuple in itertools.product(*[q.wts for q in quad_rules])]
-    return QuadratureRule(ref_el, pts, wts)
+    return TensorProductQuadratureRule(*quad_rules)
 
 
 # rule to get Gauss-Jacobi points
@@ -215,11 +215,40 @@ class Cell(object):
 
     def get_entity_transform(self, dim, entity_i):
         """Returns a mapping of point coordinates from the
-        `entity_i`-th subentity of dimension `dim` to the cell.
+        `entity_i`-th subentity of dimension `dim` to the cell.  The
+        mapping takes a single point or an (npts, d) array of points.
 
         :arg dim: `tuple` for tensor product cells, `int` otherwise
         :arg entity_i: entity number (integer)
         """
+        C, offset = self.get_entity_affine_map(dim, entity_i)
+
+        def transform(x):
+            return numpy.dot(numpy.asarray(x, dtype=float), C.T) + offset
+        return transform
+
+    def get_entity_affine_map(self, dim, entity_i):
+        """Returns the pair (C, offset) such that x --> C x + offset maps
+        the `entity_i`-th subentity of dimension `dim` to the cell.  The
+        pairs are computed once per cell and must not be modified.
+
+        :arg dim: `tuple` for tensor product cells, `int` otherwise
+        :arg entity_i: entity number (integer)
+        """
+        try:
+            cache = self._entity_affine_maps
+        except AttributeError:
+            cache = self._entity_affine_maps = {}
+        try:
+            return cache[(dim, entity_i)]
+        except KeyError:
+            C, offset = self._compute_entity_affine_map(dim, entity_i)
+            C.flags.writeable = False
+            offset.flags.writeable = False
+            return cache.setdefault((dim, entity_i), (C, offset))
+
+    def _compute_entity_affine_map(self, dim, entity_i):
+        """Computes the pair returned by get_entity_affine_map."""
         raise NotImplementedError("Should be implemented in a subclass.")
 
 
@@ -388,9 +417,9 @@ class Simplex(Cell):
         n = Simplex.compute_normal(self, facet_i)  # skip UFC overrides
         return n / numpy.linalg.norm(n, numpy.inf)
 
-    def get_entity_transform(self, dim, entity):
-        """Returns a mapping of point coordinates from the
-        `entity`-th subentity of dimension `dim` to the cell.
+    def _compute_entity_affine_map(self, dim, entity):
+        """Computes the affine map from the `entity`-th subentity of
+        dimension `dim` to the cell.
 
         :arg dim: subentity dimension (integer)
         :arg entity: entity number (integer)
@@ -402,17 +431,17 @@ class Simplex(Cell):
             # Special case vertices.
             i, = topology[dim][entity]
             vertex = self.get_vertices()[i]
-            return lambda point: vertex
+            return numpy.zeros((celldim, 0)), numpy.array(vertex, dtype=float)
         elif dim == celldim:
             assert entity == 0
-            return lambda point: point
+            return numpy.eye(celldim), numpy.zeros(celldim)
 
         try:
             subcell = self.construct_subelement(dim)
         except NotImplementedError:
             # Special case for 1D elements.
             x_c, = self.get_vertices_of_subcomplex(topology[0][entity])
-            return lambda x: x_c
+            return numpy.zeros((celldim, dim)), numpy.array(x_c, dtype=float)
 
         subdim = subcell.get_spatial_dimension()
 
@@ -439,7 +468,7 @@ class Simplex(Cell):
 
         offset = v_c[0] - C.dot(v_e[0])
 
-        return lambda x: offset + C.dot(x)
+        return C, offset
 
     def get_dimension(self):
         """Returns the subelement dimension of the cell.  Same as the
@@ -707,9 +736,10 @@ class TensorProductCell(Cell):
         return TensorProductCell(*[c.construct_subelement(d)
                                    for c, d in zip(self.cells, dimension)])
 
-    def get_entity_transform(self, dim, entity_i):
-        """Returns a mapping of point coordinates from the
-        `entity_i`-th subentity of dimension `dim` to the cell.
+    def _compute_entity_affine_map(self, dim, entity_i):
+        """Computes the affine map from the `entity_i`-th subentity of
+        dimension `dim` to the cell, which is block diagonal in the
+        factors.
 
         :arg dim: subelement dimension (tuple)
         :arg entity_i: entity number (integer)
@@ -719,16 +749,19 @@ class TensorProductCell(Cell):
                       for c, d in zip(self.cells, dim))
         alpha = numpy.unravel_index(entity_i, shape)
 
-        # entity transform on each subcell
-        sct = [c.get_entity_transform(d, i)
-               for c, d, i in zip(self.cells, dim, alpha)]
+        # entity maps on each subcell
+        maps = [c.get_entity_affine_map(d, i)
+                for c, d, i in zip(self.cells, dim, alpha)]
 
-        slices = TensorProductCell._split_slices(dim)
-
-        def transform(point):
-            return list(chain(*[t(point[s])
-                                for t, s in zip(sct, slices)]))
-        return transform
+        C = numpy.zeros((sum(Ci.shape[0] for Ci, _ in maps),
+                         sum(Ci.shape[1] for Ci, _ in maps)))
+        row = col = 0
+        for Ci, _ in maps:
+            C[row:row + Ci.shape[0], col:col + Ci.shape[1]] = Ci
+            row += Ci.shape[0]
+            col += Ci.shape[1]
+        offset = numpy.concatenate([offset_i for _, offset_i in maps])
+        return C, offset
 
     def volume(self):
         """Computes the volume in the appropriate dimensional measure."""
@@ -797,15 +830,15 @@ class UFCQuadrilateral(Cell):
         else:
             raise ValueError("Invalid dimension: %d" % (dimension,))
 
-    def get_entity_transform(self, dim, entity_i):
-        """Returns a mapping of point coordinates from the
-        `entity_i`-th subentity of dimension `dim` to the cell.
+    def _compute_entity_affine_map(self, dim, entity_i):
+        """Computes the affine map from the `entity_i`-th subentity of
+        dimension `dim` to the cell.
 
         :arg dim: entity dimension (integer)
         :arg entity_i: entity number (integer)
         """
         d, e = self.unflattening_map[(dim, entity_i)]
-        return self.product.get_entity_transform(d, e)
+        return self.product.get_entity_affine_map(d, e)
 
     def volume(self):
         """Computes the volume in the appropriate dimensional measure."""
@@ -862,15 +895,15 @@ class UFCHexahedron(Cell):
         else:
             raise ValueError("Invalid dimension: %d" % (dimension,))
 
-    def get_entity_transform(self, dim, entity_i):
-        """Returns a mapping of point coordinates from the
-        `entity_i`-th subentity of dimension `dim` to the cell.
+    def _compute_entity_affine_map(self, dim, entity_i):
+        """Computes the affine map from the `entity_i`-th subentity of
+        dimension `dim` to the cell.
 
         :arg dim: entity dimension (integer)
         :arg entity_i: entity number (integer)
         """
         d, e = self.unflattening_map[(dim, entity_i)]
-        return self.product.get_entity_transform(d, e)
+        return self.product.get_entity_affine_map(d, e)
 
     def volume(self):
         """Computes the volume in the appropriate dimensional measure."""
@@ -1014,6 +1047,16 @@ def tuple_sum(tree):
         return tree
 
 
+def geometric_key(cell):
+    """Returns a hashable key of the type, vertices and topology of
+    cell.  Unlike cell equality, which only compares types, the key
+    tells apart cells of the same type with different vertices."""
+    vertices = tuple(tuple(float(x) for x in v) for v in cell.get_vertices())
+    topology = tuple((dim, tuple(sorted(entities.items())))
+                     for dim, entities in sorted(cell.get_topology().items()))
+    return (type(cell), vertices, topology)
+
+
 def is_hypercube(cell):
     if isinstance(cell, (DefaultLine, UFCInterval, UFCQuadrilateral, UFCHexahedron)):
         return True
@@ -32,13 +32,11 @@ class RestrictedElement(CiarletElement):
         # Fetch reference element
         ref_el = element.get_reference_element()
 
-        # Restrict primal set
-        poly_set = element.get_nodal_basis().take(indices)
-
         # Restrict dual set
         dof_counter = 0
         entity_ids = {}
         nodes = []
+        dofs_kept = []
         nodes_old = element.dual_basis()
         for d, entities in element.entity_dofs().items():
             entity_ids[d] = {}
@@ -50,16 +48,22 @@ class RestrictedElement(CiarletElement):
                     entity_ids[d][entity].append(dof_counter)
                     dof_counter += 1
                     nodes.append(nodes_old[dof])
+                    dofs_kept.append(dof)
         assert dof_counter == len(indices)
         dual = DualSet(nodes, ref_el, entity_ids)
 
+        # Restrict primal set, in the order of the restricted nodes
+        poly_set = element.get_nodal_basis().take(dofs_kept)
+
         # Restrict mapping
         mapping_old = element.mapping()
         mapping_new = [mapping_old[dof] for dof in indices]
         assert all(e_mapping == mapping_new[0] for e_mapping in mapping_new)
 
-        # Call constructor of CiarletElement
-        super(RestrictedElement, self).__init__(poly_set, dual, 0, element.get_formdegree(), mapping_new[0])
+        # Call constructor of CiarletElement, the restricted nodal
+        # basis is dual to the restricted nodes already
+        super(RestrictedElement, self).__init__(poly_set, dual, 0, element.get_formdegree(), mapping_new[0],
+                                                nodal=True)
 
 
 def sorted_by_key(mapping):
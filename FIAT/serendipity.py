@@ -141,7 +141,7 @@ class Serendipity(FiniteElement):
 
         entity_dim, entity_id = entity
         transform = self.ref_el.get_entity_transform(entity_dim, entity_id)
-        points = list(map(transform, points))
+        points = transform(points)
 
         phivals = {}
         dim = self.flat_el.get_spatial_dimension()
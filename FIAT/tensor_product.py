@@ -6,11 +6,16 @@
 #
 # SPDX-License-Identifier:    LGPL-3.0-or-later
 
+import numbers
+from functools import reduce
+from itertools import product
+
 import numpy
-from FIAT.finite_element import FiniteElement
+from FIAT.finite_element import FiniteElement, point_array, stack_tables
 from FIAT.reference_element import TensorProductCell, UFCQuadrilateral, UFCHexahedron, flatten_entities, compute_unflattening_map
 from FIAT.dual_set import DualSet
-from FIAT.polynomial_set import mis
+from FIAT.polynomial_set import derivative_indices
+from FIAT.quadrature import TensorProductQuadratureRule
 from FIAT import dual_set
 from FIAT import functional
 
@@ -23,196 +28,304 @@ def _first_point_pair(node):
     return tuple(node.get_point_dict().items())[0]
 
 
+def _expand(table):
+    return table.expand() if isinstance(table, KroneckerTable) else table
+
+
+def _apply(table, x):
+    """Contracts the last axis of x with the first axis of table."""
+    return table.apply(x) if isinstance(table, KroneckerTable) else numpy.dot(x, table)
+
+
+def _transpose_apply(table, x):
+    """Contracts the last axis of x with the last axis of table."""
+    return table.transpose_apply(x) if isinstance(table, KroneckerTable) else numpy.dot(x, table.T)
+
+
+class KroneckerTable(object):
+    """A table T[i, j] of the basis functions i of a tensor product
+    element at the points j of a tensor product point set, stored as
+    the Kronecker product of the tables of the factors (which may be
+    KroneckerTables again).  Basis functions and points are numbered
+    with the last factor running fastest."""
+
+    def __init__(self, *factors):
+        self.factors = tuple(factors)
+
+    @property
+    def shape(self):
+        return tuple(int(numpy.prod(n)) for n in zip(*(table.shape for table in self.factors)))
+
+    def expand(self):
+        """Returns the table as an array."""
+        return reduce(numpy.kron, map(_expand, self.factors))
+
+    def _sum_factorise(self, apply, x, axis):
+        """Applies every factor to its own axis of x."""
+        n = len(self.factors)
+        x = numpy.asarray(x)
+        shape = x.shape[:-1]
+        x = numpy.reshape(x, shape + tuple(table.shape[axis] for table in self.factors))
+        for i in reversed(range(n)):
+            x = numpy.moveaxis(x, i - n, -1)
+            x = numpy.moveaxis(apply(self.factors[i], x), -1, i - n)
+        return numpy.reshape(x, shape + (-1,))
+
+    def apply(self, coeffs):
+        """Returns the values at the points of the functions with
+        coefficients coeffs[..., i], by sum factorisation."""
+        return self._sum_factorise(_apply, coeffs, 0)
+
+    def transpose_apply(self, values):
+        """Returns sum_j T[i, j] values[..., j], by sum factorisation."""
+        return self._sum_factorise(_transpose_apply, values, 1)
+
+
+def _tabulate_factor(element, order, points, entity):
+    if isinstance(points, tuple) and hasattr(element, "tabulate_factored"):
+        return element.tabulate_factored(order, points, entity)
+    return element.tabulate(order, points, entity)
+
+
+def _rule_factors(rule):
+    """Returns the quadrature rules on the non-product cells that a
+    tensor product quadrature rule is built from."""
+    if isinstance(rule, TensorProductQuadratureRule):
+        return sum((_rule_factors(q) for q in rule.get_factors()), [])
+    return [rule]
+
+
+def _factor_point_sets(element, rules):
+    """Groups the point sets of the rules into nested tuples matching
+    the factors of a (possibly nested) tensor product element."""
+    if isinstance(element, FlattenedDimensions):
+        element = element.element
+    if not isinstance(element, TensorProductElement):
+        if len(rules) == 1:
+            return rules[0].get_points()
+        return TensorProductQuadratureRule(*rules).get_points()
+
+    sdims = numpy.cumsum([q.ref_el.get_spatial_dimension() for q in rules])
+    factor_sdims = numpy.cumsum([f.ref_el.get_spatial_dimension() for f in element.factors])
+    splits = numpy.searchsorted(sdims, factor_sdims) + 1
+    if splits[-1] != len(rules) or not numpy.array_equal(sdims[numpy.minimum(splits, len(rules)) - 1], factor_sdims):
+        raise ValueError("Quadrature rule does not match the factors of the element")
+    return tuple(_factor_point_sets(f, rules[start:stop])
+                 for f, start, stop in zip(element.factors, [0] + list(splits[:-1]), splits))
+
+
+def _product_nodes(ref_el, Anodes, Bnodes):
+    """Returns the dual basis of the tensor product of two elements
+    with dual bases Anodes and Bnodes on the product cell ref_el."""
+    # build the dual set by inspecting the current dual
+    # sets item by item.
+    # Currently supported cases:
+    # PointEval x PointEval = PointEval [scalar x scalar = scalar]
+    # PointScaledNormalEval x PointEval = PointScaledNormalEval [vector x scalar = vector]
+    # ComponentPointEvaluation x PointEval [vector x scalar = vector]
+    nodes = []
+    for Anode in Anodes:
+        if isinstance(Anode, functional.PointEvaluation):
+            for Bnode in Bnodes:
+                if isinstance(Bnode, functional.PointEvaluation):
+                    # case: PointEval x PointEval
+                    # the PointEval functional just requires the
+                    # coordinates. these are currently stored as
+                    # the key of a one-item dictionary. we retrieve
+                    # these by calling get_point_dict(), and
+                    # use the concatenation to make a new PointEval
+                    nodes.append(functional.PointEvaluation(ref_el, _first_point(Anode) + _first_point(Bnode)))
+                elif isinstance(Bnode, functional.IntegralMoment):
+                    # dummy functional for product with integral moments
+                    nodes.append(functional.Functional(None, None, None,
+                                                       {}, "Undefined"))
+                elif isinstance(Bnode, functional.PointDerivative):
+                    # dummy functional for product with point derivative
+                    nodes.append(functional.Functional(None, None, None,
+                                                       {}, "Undefined"))
+                else:
+                    raise NotImplementedError("unsupported functional type")
+
+        elif isinstance(Anode, functional.PointScaledNormalEvaluation):
+            for Bnode in Bnodes:
+                if isinstance(Bnode, functional.PointEvaluation):
+                    # case: PointScaledNormalEval x PointEval
+                    # this could be wrong if the second shape
+                    # has spatial dimension >1, since we are not
+                    # explicitly scaling by facet size
+                    if len(_first_point(Bnode)) > 1:
+                        # TODO: support this case one day
+                        raise NotImplementedError("PointScaledNormalEval x PointEval is not yet supported if the second shape has dimension > 1")
+                    # We cannot make a new functional.PSNEval in
+                    # the natural way, since it tries to compute
+                    # the normal vector by itself.
+                    # Instead, we create things manually, and
+                    # call Functional() with these arguments
+                    sd = ref_el.get_spatial_dimension()
+                    # The pt_dict is a one-item dictionary containing
+                    # the details of the functional.
+                    # The key is the spatial coordinate, which
+                    # is just a concatenation of the two parts.
+                    # The value is a list of tuples, representing
+                    # the normal vector (scaled by the volume of
+                    # the facet) at that point.
+                    # Each tuple looks like (foo, (i,)); the i'th
+                    # component of the scaled normal is foo.
+
+                    # The following line is only valid when the second
+                    # shape has spatial dimension 1 (enforced above)
+                    Apoint, Avalue = _first_point_pair(Anode)
+                    pt_dict = {Apoint + _first_point(Bnode): Avalue + [(0.0, (len(Apoint),))]}
+
+                    # The following line should be used in the
+                    # general case
+                    # pt_dict = {Anode.get_point_dict().keys()[0] + Bnode.get_point_dict().keys()[0]: Anode.get_point_dict().values()[0] + [(0.0, (ii,)) for ii in range(len(Anode.get_point_dict().keys()[0]), len(Anode.get_point_dict().keys()[0]) + len(Bnode.get_point_dict().keys()[0]))]}
+
+                    # THE FOLLOWING IS PROBABLY CORRECT BUT UNTESTED
+                    shp = (sd,)
+                    nodes.append(functional.Functional(ref_el, shp, pt_dict, {}, "PointScaledNormalEval"))
+                else:
+                    raise NotImplementedError("unsupported functional type")
+
+        elif isinstance(Anode, functional.PointEdgeTangentEvaluation):
+            for Bnode in Bnodes:
+                if isinstance(Bnode, functional.PointEvaluation):
+                    # case: PointEdgeTangentEval x PointEval
+                    # this is very similar to the case above, so comments omitted
+                    if len(_first_point(Bnode)) > 1:
+                        raise NotImplementedError("PointEdgeTangentEval x PointEval is not yet supported if the second shape has dimension > 1")
+                    sd = ref_el.get_spatial_dimension()
+                    Apoint, Avalue = _first_point_pair(Anode)
+                    pt_dict = {Apoint + _first_point(Bnode): Avalue + [(0.0, (len(Apoint),))]}
+
+                    # THE FOLLOWING IS PROBABLY CORRECT BUT UNTESTED
+                    shp = (sd,)
+                    nodes.append(functional.Functional(ref_el, shp, pt_dict, {}, "PointEdgeTangent"))
+                else:
+                    raise NotImplementedError("unsupported functional type")
+
+        elif isinstance(Anode, functional.ComponentPointEvaluation):
+            for Bnode in Bnodes:
+                if isinstance(Bnode, functional.PointEvaluation):
+                    # case: ComponentPointEval x PointEval
+                    # the CptPointEval functional requires the component
+                    # and the coordinates. very similar to PE x PE case.
+                    sd = ref_el.get_spatial_dimension()
+                    nodes.append(functional.ComponentPointEvaluation(ref_el, Anode.comp, (sd,), _first_point(Anode) + _first_point(Bnode)))
+                else:
+                    raise NotImplementedError("unsupported functional type")
+
+        elif isinstance(Anode, functional.FrobeniusIntegralMoment):
+            for Bnode in Bnodes:
+                if isinstance(Bnode, functional.PointEvaluation):
+                    # case: FroIntMom x PointEval
+                    sd = ref_el.get_spatial_dimension()
+                    pt_dict = {}
+                    pt_old = Anode.get_point_dict()
+                    for pt in pt_old:
+                        pt_dict[pt+_first_point(Bnode)] = pt_old[pt] + [(0.0, sd-1)]
+                    # THE FOLLOWING IS PROBABLY CORRECT BUT UNTESTED
+                    shp = (sd,)
+                    nodes.append(functional.Functional(ref_el, shp, pt_dict, {}, "FrobeniusIntegralMoment"))
+                else:
+                    raise NotImplementedError("unsupported functional type")
+
+        elif isinstance(Anode, functional.IntegralMoment):
+            for Bnode in Bnodes:
+                if isinstance(Bnode, functional.PointEvaluation):
+                    # case: IntMom x PointEval
+                    sd = ref_el.get_spatial_dimension()
+                    pt_dict = {}
+                    pt_old = Anode.get_point_dict()
+                    for pt in pt_old:
+                        pt_dict[pt+_first_point(Bnode)] = pt_old[pt]
+                    # THE FOLLOWING IS PROBABLY CORRECT BUT UNTESTED
+                    shp = (sd,)
+                    nodes.append(functional.Functional(ref_el, shp, pt_dict, {}, "IntegralMoment"))
+                else:
+                    raise NotImplementedError("unsupported functional type")
+
+        elif isinstance(Anode, functional.Functional):
+            # this should catch everything else
+            for Bnode in Bnodes:
+                nodes.append(functional.Functional(None, None, None, {}, "Undefined"))
+        else:
+            raise NotImplementedError("unsupported functional type")
+    return nodes
+
+
 class TensorProductElement(FiniteElement):
     """Class implementing a finite element that is the tensor product
-    of two existing finite elements."""
+    of two or more existing finite elements.  The value shape is the
+    outer product of the value shapes of the factors."""
 
-    def __init__(self, A, B):
+    def __init__(self, *factors):
+        if len(factors) < 2:
+            raise ValueError("Tensor product element needs at least two factors")
         # set up simple things
-        order = min(A.get_order(), B.get_order())
-        if A.get_formdegree() is None or B.get_formdegree() is None:
+        order = min(f.get_order() for f in factors)
+        if any(f.get_formdegree() is None for f in factors):
             formdegree = None
         else:
-            formdegree = A.get_formdegree() + B.get_formdegree()
+            formdegree = sum(f.get_formdegree() for f in factors)
 
         # set up reference element
-        ref_el = TensorProductCell(A.get_reference_element(),
-                                   B.get_reference_element())
-
-        if A.mapping()[0] != "affine" and B.mapping()[0] == "affine":
-            mapping = A.mapping()[0]
-        elif B.mapping()[0] != "affine" and A.mapping()[0] == "affine":
-            mapping = B.mapping()[0]
-        elif A.mapping()[0] == "affine" and B.mapping()[0] == "affine":
-            mapping = "affine"
-        else:
-            raise ValueError("check tensor product mappings - at least one must be affine")
+        ref_el = TensorProductCell(*[f.get_reference_element() for f in factors])
+
+        mappings = [f.mapping()[0] for f in factors if f.mapping()[0] != "affine"]
+        if len(mappings) > 1:
+            raise ValueError("check tensor product mappings - at most one may be non-affine")
+        mapping = mappings[0] if mappings else "affine"
 
-        # set up entity_ids
-        Adofs = A.entity_dofs()
-        Bdofs = B.entity_dofs()
-        Bsdim = B.space_dimension()
+        # set up entity_ids, with the entities and dofs of the last
+        # factor running fastest
+        dofs = [f.entity_dofs() for f in factors]
+        strides = numpy.cumprod([1] + [f.space_dimension() for f in factors[:0:-1]])[::-1]
         entity_ids = {}
 
-        for curAdim in Adofs:
-            for curBdim in Bdofs:
-                entity_ids[(curAdim, curBdim)] = {}
-                dim_cur = 0
-                for entityA in Adofs[curAdim]:
-                    for entityB in Bdofs[curBdim]:
-                        entity_ids[(curAdim, curBdim)][dim_cur] = \
-                            [x*Bsdim + y for x in Adofs[curAdim][entityA]
-                                for y in Bdofs[curBdim][entityB]]
-                        dim_cur += 1
-
-        # set up dual basis
-        Anodes = A.dual_basis()
-        Bnodes = B.dual_basis()
-
-        # build the dual set by inspecting the current dual
-        # sets item by item.
-        # Currently supported cases:
-        # PointEval x PointEval = PointEval [scalar x scalar = scalar]
-        # PointScaledNormalEval x PointEval = PointScaledNormalEval [vector x scalar = vector]
-        # ComponentPointEvaluation x PointEval [vector x scalar = vector]
-        nodes = []
-        for Anode in Anodes:
-            if isinstance(Anode, functional.PointEvaluation):
-                for Bnode in Bnodes:
-                    if isinstance(Bnode, functional.PointEvaluation):
-                        # case: PointEval x PointEval
-                        # the PointEval functional just requires the
-                        # coordinates. these are currently stored as
-                        # the key of a one-item dictionary. we retrieve
-                        # these by calling get_point_dict(), and
-                        # use the concatenation to make a new PointEval
-                        nodes.append(functional.PointEvaluation(ref_el, _first_point(Anode) + _first_point(Bnode)))
-                    elif isinstance(Bnode, functional.IntegralMoment):
-                        # dummy functional for product with integral moments
-                        nodes.append(functional.Functional(None, None, None,
-                                                           {}, "Undefined"))
-                    elif isinstance(Bnode, functional.PointDerivative):
-                        # dummy functional for product with point derivative
-                        nodes.append(functional.Functional(None, None, None,
-                                                           {}, "Undefined"))
-                    else:
-                        raise NotImplementedError("unsupported functional type")
-
-            elif isinstance(Anode, functional.PointScaledNormalEvaluation):
-                for Bnode in Bnodes:
-                    if isinstance(Bnode, functional.PointEvaluation):
-                        # case: PointScaledNormalEval x PointEval
-                        # this could be wrong if the second shape
-                        # has spatial dimension >1, since we are not
-                        # explicitly scaling by facet size
-                        if len(_first_point(Bnode)) > 1:
-                            # TODO: support this case one day
-                            raise NotImplementedError("PointScaledNormalEval x PointEval is not yet supported if the second shape has dimension > 1")
-                        # We cannot make a new functional.PSNEval in
-                        # the natural way, since it tries to compute
-                        # the normal vector by itself.
-                        # Instead, we create things manually, and
-                        # call Functional() with these arguments
-                        sd = ref_el.get_spatial_dimension()
-                        # The pt_dict is a one-item dictionary containing
-                        # the details of the functional.
-                        # The key is the spatial coordinate, which
-                        # is just a concatenation of the two parts.
-                        # The value is a list of tuples, representing
-                        # the normal vector (scaled by the volume of
-                        # the facet) at that point.
-                        # Each tuple looks like (foo, (i,)); the i'th
-                        # component of the scaled normal is foo.
-
-                        # The following line is only valid when the second
-                        # shape has spatial dimension 1 (enforced above)
-                        Apoint, Avalue = _first_point_pair(Anode)
-                        pt_dict = {Apoint + _first_point(Bnode): Avalue + [(0.0, (len(Apoint),))]}
-
-                        # The following line should be used in the
-                        # general case
-                        # pt_dict = {Anode.get_point_dict().keys()[0] + Bnode.get_point_dict().keys()[0]: Anode.get_point_dict().values()[0] + [(0.0, (ii,)) for ii in range(len(Anode.get_point_dict().keys()[0]), len(Anode.get_point_dict().keys()[0]) + len(Bnode.get_point_dict().keys()[0]))]}
-
-                        # THE FOLLOWING IS PROBABLY CORRECT BUT UNTESTED
-                        shp = (sd,)
-                        nodes.append(functional.Functional(ref_el, shp, pt_dict, {}, "PointScaledNormalEval"))
-                    else:
-                        raise NotImplementedError("unsupported functional type")
-
-            elif isinstance(Anode, functional.PointEdgeTangentEvaluation):
-                for Bnode in Bnodes:
-                    if isinstance(Bnode, functional.PointEvaluation):
-                        # case: PointEdgeTangentEval x PointEval
-                        # this is very similar to the case above, so comments omitted
-                        if len(_first_point(Bnode)) > 1:
-                            raise NotImplementedError("PointEdgeTangentEval x PointEval is not yet supported if the second shape has dimension > 1")
-                        sd = ref_el.get_spatial_dimension()
-                        Apoint, Avalue = _first_point_pair(Anode)
-                        pt_dict = {Apoint + _first_point(Bnode): Avalue + [(0.0, (len(Apoint),))]}
-
-                        # THE FOLLOWING IS PROBABLY CORRECT BUT UNTESTED
-                        shp = (sd,)
-                        nodes.append(functional.Functional(ref_el, shp, pt_dict, {}, "PointEdgeTangent"))
-                    else:
-                        raise NotImplementedError("unsupported functional type")
-
-            elif isinstance(Anode, functional.ComponentPointEvaluation):
-                for Bnode in Bnodes:
-                    if isinstance(Bnode, functional.PointEvaluation):
-                        # case: ComponentPointEval x PointEval
-                        # the CptPointEval functional requires the component
-                        # and the coordinates. very similar to PE x PE case.
-                        sd = ref_el.get_spatial_dimension()
-                        nodes.append(functional.ComponentPointEvaluation(ref_el, Anode.comp, (sd,), _first_point(Anode) + _first_point(Bnode)))
-                    else:
-                        raise NotImplementedError("unsupported functional type")
-
-            elif isinstance(Anode, functional.FrobeniusIntegralMoment):
-                for Bnode in Bnodes:
-                    if isinstance(Bnode, functional.PointEvaluation):
-                        # case: FroIntMom x PointEval
-                        sd = ref_el.get_spatial_dimension()
-                        pt_dict = {}
-                        pt_old = Anode.get_point_dict()
-                        for pt in pt_old:
-                            pt_dict[pt+_first_point(Bnode)] = pt_old[pt] + [(0.0, sd-1)]
-                        # THE FOLLOWING IS PROBABLY CORRECT BUT UNTESTED
-                        shp = (sd,)
-                        nodes.append(functional.Functional(ref_el, shp, pt_dict, {}, "FrobeniusIntegralMoment"))
-                    else:
-                        raise NotImplementedError("unsupported functional type")
-
-            elif isinstance(Anode, functional.IntegralMoment):
-                for Bnode in Bnodes:
-                    if isinstance(Bnode, functional.PointEvaluation):
-                        # case: IntMom x PointEval
-                        sd = ref_el.get_spatial_dimension()
-                        pt_dict = {}
-                        pt_old = Anode.get_point_dict()
-                        for pt in pt_old:
-                            pt_dict[pt+_first_point(Bnode)] = pt_old[pt]
-                        # THE FOLLOWING IS PROBABLY CORRECT BUT UNTESTED
-                        shp = (sd,)
-                        nodes.append(functional.Functional(ref_el, shp, pt_dict, {}, "IntegralMoment"))
-                    else:
-                        raise NotImplementedError("unsupported functional type")
-
-            elif isinstance(Anode, functional.Functional):
-                # this should catch everything else
-                for Bnode in Bnodes:
-                    nodes.append(functional.Functional(None, None, None, {}, "Undefined"))
+        for dim in product(*dofs):
+            entity_ids[dim] = {}
+            entities = product(*[fdofs[d].values() for fdofs, d in zip(dofs, dim)])
+            for dim_cur, entity in enumerate(entities):
+                entity_ids[dim][dim_cur] = [int(numpy.dot(strides, x))
+                                            for x in product(*entity)]
+
+        # set up dual basis by folding the factors from the left
+        nodes = factors[0].dual_basis()
+        scalar = not factors[0].value_shape()
+        for i, f in enumerate(factors[1:], start=2):
+            partial_cell = ref_el if i == len(factors) else TensorProductCell(*ref_el.cells[:i])
+            if scalar or not f.value_shape():
+                nodes = _product_nodes(partial_cell, nodes, f.dual_basis())
             else:
-                raise NotImplementedError("unsupported functional type")
+                # dummy functionals for outer products of vector valued factors
+                nodes = [functional.Functional(None, None, None, {}, "Undefined")
+                         for _ in range(len(nodes) * f.space_dimension())]
+            scalar = scalar and not f.value_shape()
 
         dual = dual_set.DualSet(nodes, ref_el, entity_ids)
 
         super(TensorProductElement, self).__init__(ref_el, dual, order, formdegree, mapping)
         # Set up constituent elements
-        self.A = A
-        self.B = B
+        self.factors = tuple(factors)
 
         # degree for quadrature rule
-        self.polydegree = max(A.degree(), B.degree())
+        self.polydegree = max(f.degree() for f in factors)
+
+    @property
+    def A(self):
+        """The first factor of a product of two elements."""
+        return self._binary_factors()[0]
+
+    @property
+    def B(self):
+        """The second factor of a product of two elements."""
+        return self._binary_factors()[1]
+
+    def _binary_factors(self):
+        if len(self.factors) != 2:
+            raise NotImplementedError("Element is a product of %d factors, use factors" % len(self.factors))
+        return self.factors
 
     def degree(self):
         """Return the degree of the (embedding) polynomial space."""
@@ -228,123 +341,131 @@ class TensorProductElement(FiniteElement):
         finite element."""
         raise NotImplementedError("get_coeffs not implemented")
 
-    def tabulate(self, order, points, entity=None):
-        """Return tabulated values of derivatives up to given order of
-        basis functions at given points."""
+    def _factor_entities(self, entity):
+        """Factors an entity of the product cell into entities of the
+        factor cells."""
         if entity is None:
             entity = (self.ref_el.get_dimension(), 0)
         entity_dim, entity_id = entity
-
         shape = tuple(len(c.get_topology()[d])
                       for c, d in zip(self.ref_el.cells, entity_dim))
-        idA, idB = numpy.unravel_index(entity_id, shape)
+        return list(zip(entity_dim, numpy.unravel_index(entity_id, shape)))
 
-        # Factor the entity argument to get entities of the component elements
-        entityA_dim, entityB_dim = entity_dim
-        entityA = (entityA_dim, idA)
-        entityB = (entityB_dim, idB)
+    def _split_points(self, points, dim):
+        """Splits points on the product entities of dimension dim into
+        the points of the factors."""
+        sdims = [c.get_spatial_dimension()
+                 for c in self.ref_el.construct_subelement(dim).cells]
+        points = point_array(points, sum(sdims))
+        offsets = numpy.cumsum([0] + sdims)
+        return [points[:, start:stop] for start, stop in zip(offsets[:-1], offsets[1:])]
 
-        pointsAdim, pointsBdim = [c.get_spatial_dimension()
-                                  for c in self.ref_el.construct_subelement(entity_dim).cells]
-        pointsA = [point[:pointsAdim] for point in points]
-        pointsB = [point[pointsAdim:pointsAdim + pointsBdim] for point in points]
+    def tabulate(self, order, points, entity=None):
+        """Return tabulated values of derivatives up to given order of
+        basis functions at given points."""
+        entities = self._factor_entities(entity)
+        factor_points = self._split_points(points, tuple(d for d, _ in entities))
 
-        Asdim = self.A.ref_el.get_spatial_dimension()
-        Bsdim = self.B.ref_el.get_spatial_dimension()
         # Note that for entities other than cells, the following
         # tabulations are already appropriately zero-padded so no
         # additional zero padding is required.
-        Atab = self.A.tabulate(order, pointsA, entityA)
-        Btab = self.B.tabulate(order, pointsB, entityB)
-        npoints = len(points)
-
-        # allow 2 scalar-valued FE spaces, or 1 scalar-valued,
-        # 1 vector-valued. Combining 2 vector-valued spaces
-        # into a tensor-valued space via an outer-product
-        # seems to be a sensible general option, but I don't
-        # know how to handle the nestedness of the arrays
-        # if someone then tries to make a new "tensor finite
-        # element" where one component is already a
-        # tensor-valued space!
-        A_valuedim = len(self.A.value_shape())  # scalar: 0, vector: 1
-        B_valuedim = len(self.B.value_shape())  # scalar: 0, vector: 1
-        if A_valuedim + B_valuedim > 1:
-            raise NotImplementedError("tabulate does not support two vector-valued inputs")
+        tables = [f.tabulate(o, x, e)
+                  for f, o, x, e in zip(self.factors, self._factor_orders(order),
+                                        factor_points, entities)]
+        return self._tabulate_product(order, tables)
+
+    def tabulate_factored(self, order, points, entity=None):
+        """Return tabulated values of derivatives up to given order of
+        basis functions at the tensor product of point sets, as
+        KroneckerTables of the tables of the factors.  Only scalar
+        valued factors are supported.
+
+        :arg order: The maximum order of derivative, or a collection of
+                    multi-indices.
+        :arg points: A tuple of the point sets of the factors.  The
+                     point set of a factor that is itself a tensor
+                     product element may again be such a tuple.  May
+                     also be a TensorProductQuadratureRule, whose
+                     factor rules are then matched to the factors.
+        :arg entity: Optional (dimension, entity number) pair
+                     indicating which topological entity of the
+                     reference element to tabulate on.
+        """
+        if any(f.value_shape() for f in self.factors):
+            raise NotImplementedError("Factored tabulation needs scalar valued factors")
+        if isinstance(points, TensorProductQuadratureRule):
+            points = _factor_point_sets(self, _rule_factors(points))
+
+        tables = [_tabulate_factor(f, o, x, e)
+                  for f, o, x, e in zip(self.factors, self._factor_orders(order),
+                                        points, self._factor_entities(entity))]
+        slices = self._factor_slices()
+        return {alpha: KroneckerTable(*[tab[alpha[s]] for tab, s in zip(tables, slices)])
+                for alpha in derivative_indices(self.ref_el.get_spatial_dimension(), order)}
+
+    def _factor_slices(self):
+        """Returns the slices of a multi-index of the product cell
+        belonging to each factor."""
+        sdims = [c.get_spatial_dimension() for c in self.ref_el.cells]
+        offsets = numpy.cumsum([0] + sdims)
+        return [slice(start, stop) for start, stop in zip(offsets[:-1], offsets[1:])]
+
+    def _factor_orders(self, order):
+        """Splits the derivatives to tabulate (a maximum order or a
+        collection of multi-indices) into those of the factors."""
+        if isinstance(order, numbers.Integral):
+            return [order] * len(self.factors)
+        alphas = derivative_indices(self.ref_el.get_spatial_dimension(), order)
+        return [sorted(set(alpha[s] for alpha in alphas))
+                for s in self._factor_slices()]
+
+    def tabulate_all_entities(self, order, points, dim):
+        """Return tabulated values of derivatives up to given order of
+        basis functions at given points on every entity of dimension
+        dim.  The factors are tabulated once on all their entities."""
+        factor_points = self._split_points(points, dim)
+        tables = [f.tabulate_all_entities(o, x, d)
+                  for f, o, x, d in zip(self.factors, self._factor_orders(order),
+                                        factor_points, dim)]
+        # Product entities are numbered with the last entity running fastest
+        return stack_tables([self._tabulate_product(order,
+                                                    [{alpha: tab[i] for alpha, tab in tabs.items()}
+                                                     for tabs, i in zip(tables, entity)])
+                             for entity in product(*[range(len(c.get_topology()[d]))
+                                                     for c, d in zip(self.ref_el.cells, dim)])])
+
+    def _tabulate_product(self, order, tables):
+        """Combines tabulations of the factors at the same points into
+        the tabulation of the product element."""
+        # The product basis functions are ordered f1g1, f1g2, ...,
+        # f2g1, f2g2, ..., which is compatible with the entity_dofs
+        # order; the value indices of f, g, ... come next, and the
+        # points last.  Each factor table is given singleton axes for
+        # the indices of the other factors, so that the product is a
+        # single broadcast multiplication.
+        n = len(self.factors)
+        ranks = [len(f.value_shape()) for f in self.factors]
+        ndim = n + sum(ranks) + 1
+
+        def expand_dims(table, i):
+            shape = [1] * ndim
+            shape[i] = table.shape[0]
+            start = n + sum(ranks[:i])
+            shape[start:start + ranks[i]] = table.shape[1:-1]
+            shape[-1] = table.shape[-1]
+            return numpy.reshape(table, shape)
+
         result = {}
-        for i in range(order + 1):
-            alphas = mis(Asdim+Bsdim, i)  # thanks, Rob!
-            for alpha in alphas:
-                if A_valuedim == 0 and B_valuedim == 0:
-                    # for each point, get outer product of (A's basis
-                    # functions f1, f2, ... evaluated at that point)
-                    # with (B's basis functions g1, g2, ... evaluated
-                    # at that point). This gives temp[point][f_i][g_j].
-                    # Flatten this, so bfs are
-                    # in the order f1g1, f1g2, ..., f2g1, f2g2, ...
-                    # which is compatible with the entity_dofs order.
-                    # We now have temp[point][full basis function]
-                    # Transpose this to get temp[bf][point],
-                    # and we are done.
-                    temp = numpy.array([numpy.outer(
-                                       Atab[alpha[0:Asdim]][..., j],
-                                       Btab[alpha[Asdim:Asdim+Bsdim]][..., j])
-                        .ravel() for j in range(npoints)])
-                    result[alpha] = temp.transpose()
-                elif A_valuedim == 1 and B_valuedim == 0:
-                    # similar to above, except A's basis functions
-                    # are now vector-valued. numpy.outer flattens the
-                    # array, so it's like taking the OP of
-                    # f1_x, f1_y, f2_x, f2_y, ... with g1, g2, ...
-                    # this gives us
-                    # temp[point][f1x, f1y, f2x, f2y, ...][g_j].
-                    # reshape once to get temp[point][f_i][x/y][g_j]
-                    # transpose to get temp[point][x/y][f_i][g_j]
-                    # reshape to flatten the last two indices, this
-                    # gives us temp[point][x/y][full bf_i]
-                    # finally, transpose the first and last indices
-                    # to get temp[bf_i][x/y][point], and we are done.
-                    temp = numpy.array([numpy.outer(
-                                       Atab[alpha[0:Asdim]][..., j],
-                                       Btab[alpha[Asdim:Asdim+Bsdim]][..., j])
-                        for j in range(npoints)])
-                    assert temp.shape[1] % 2 == 0
-                    temp2 = temp.reshape((temp.shape[0],
-                                          temp.shape[1]//2,
-                                          2,
-                                          temp.shape[2]))\
-                        .transpose(0, 2, 1, 3)\
-                        .reshape((temp.shape[0], 2, -1))\
-                        .transpose(2, 1, 0)
-                    result[alpha] = temp2
-                elif A_valuedim == 0 and B_valuedim == 1:
-                    # as above, with B's functions now vector-valued.
-                    # we now do... [numpy.outer ... for ...] gives
-                    # temp[point][f_i][g1x,g1y,g2x,g2y,...].
-                    # reshape to temp[point][f_i][g_j][x/y]
-                    # flatten middle: temp[point][full bf_i][x/y]
-                    # transpose to temp[bf_i][x/y][point]
-                    temp = numpy.array([numpy.outer(
-                        Atab[alpha[0:Asdim]][..., j],
-                        Btab[alpha[Asdim:Asdim+Bsdim]][..., j])
-                        for j in range(len(Atab[alpha[0:Asdim]][0]))])
-                    assert temp.shape[2] % 2 == 0
-                    temp2 = temp.reshape((temp.shape[0], temp.shape[1],
-                                          temp.shape[2]//2, 2))\
-                        .reshape((temp.shape[0], -1, 2))\
-                        .transpose(1, 2, 0)
-                    result[alpha] = temp2
+        slices = self._factor_slices()
+        for alpha in derivative_indices(self.ref_el.get_spatial_dimension(), order):
+            temp = reduce(numpy.multiply, [expand_dims(tab[alpha[s]], i)
+                                           for i, (tab, s) in enumerate(zip(tables, slices))])
+            result[alpha] = numpy.reshape(temp, (-1,) + temp.shape[n:])
         return result
 
     def value_shape(self):
         """Return the value shape of the finite element functions."""
-        if len(self.A.value_shape()) == 0 and len(self.B.value_shape()) == 0:
-            return ()
-        elif len(self.A.value_shape()) == 1 and len(self.B.value_shape()) == 0:
-            return (self.A.value_shape()[0],)
-        elif len(self.A.value_shape()) == 0 and len(self.B.value_shape()) == 1:
-            return (self.B.value_shape()[0],)
-        else:
-            raise NotImplementedError("value_shape not implemented")
+        return sum((f.value_shape() for f in self.factors), ())
 
     def dmats(self):
         """Return dmats: expansion coefficients for basis function
@@ -357,7 +478,7 @@ class TensorProductElement(FiniteElement):
 
     def is_nodal(self):
         # This element is nodal iff all factor elements are nodal.
-        return all([self.A.is_nodal(), self.B.is_nodal()])
+        return all(f.is_nodal() for f in self.factors)
 
 
 class FlattenedDimensions(FiniteElement):
@@ -406,6 +527,26 @@ class FlattenedDimensions(FiniteElement):
 
         return self.element.tabulate(order, points, product_entity)
 
+    def tabulate_factored(self, order, points, entity=None):
+        """Return tabulated values of derivatives up to given order of
+        basis functions at a tensor product of point sets as
+        KroneckerTables, see TensorProductElement.tabulate_factored."""
+        if entity is None:
+            entity = (self.get_reference_element().get_spatial_dimension(), 0)
+        return self.element.tabulate_factored(order, points, self.unflattening_map[entity])
+
+    def tabulate_all_entities(self, order, points, dim):
+        """Return tabulated values of derivatives up to given order of
+        basis functions at given points on every entity of dimension
+        dim (in flattened form)."""
+        num_entities = len(self.get_reference_element().get_topology()[dim])
+        product_entities = [self.unflattening_map[(dim, e)] for e in range(num_entities)]
+        # Tabulate once for each product dimension of the entities
+        tables = {d: self.element.tabulate_all_entities(order, points, d)
+                  for d in set(d for d, _ in product_entities)}
+        return {alpha: numpy.array([tables[d][alpha][i] for d, i in product_entities])
+                for alpha in tables[product_entities[0][0]]}
+
     def value_shape(self):
         """Return the value shape of the finite element functions."""
         return self.element.value_shape()
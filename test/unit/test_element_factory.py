@@ -0,0 +1,185 @@
+# Copyright (C) 2019 Imperial College London and others
+#
+# This file is part of FIAT.
+#
+# FIAT is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# FIAT is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with FIAT. If not, see <http://www.gnu.org/licenses/>.
+
+import pytest
+import numpy as np
+
+from FIAT import Lagrange, ufc_simplex
+from FIAT.element_factory import ElementFactory
+
+
+def test_factory_shares_elements():
+    factory = ElementFactory(Lagrange)
+    P2 = factory(ufc_simplex(2), 2)
+    assert factory(ufc_simplex(2), 2) is P2
+    assert factory(ufc_simplex(2), 3) is not P2
+    assert factory(ufc_simplex(3), 2) is not P2
+    info = factory.cache_info()
+    assert (info.hits, info.misses, info.currsize) == (1, 3, 3)
+    with pytest.raises(ValueError):
+        P2.get_coeffs()[0, 0] = 1.0
+
+    factory.cache_clear()
+    assert factory.cache_info().currsize == 0
+    assert factory(ufc_simplex(2), 2) is not P2
+
+
+def test_factory_keys_cell_vertices():
+    """Cells of the same type compare equal, but elements on cells with
+    different vertices must not be shared."""
+    from FIAT.reference_element import Simplex, TRIANGLE
+    ref = ufc_simplex(2)
+    big = Simplex(TRIANGLE, tuple(map(tuple, 2 * np.array(ref.get_vertices()))), ref.get_topology())
+    small = Simplex(TRIANGLE, ref.get_vertices(), ref.get_topology())
+    factory = ElementFactory(Lagrange)
+    P1 = factory(big, 1)
+    assert factory(small, 1) is not P1
+    assert factory(Simplex(TRIANGLE, big.get_vertices(), ref.get_topology()), 1) is P1
+    assert np.allclose(P1.tabulate(0, [(2.0, 0.0)])[(0, 0)][:, 0], [0, 1, 0])
+
+
+def test_factory_keys_sub_elements():
+    from FIAT import cached_elements
+    from FIAT.element_factory import cache_info
+    hits = cache_info(cached_elements).hits
+    P1 = cached_elements["Lagrange"](ufc_simplex(1), 1)
+    P1_again = cached_elements["Lagrange"](ufc_simplex(1), 1)
+    tpe = cached_elements["TensorProductElement"](P1, P1)
+    assert cached_elements["TensorProductElement"](P1_again, P1) is tpe
+    mixed = cached_elements["MixedElement"]([P1, P1])
+    assert cached_elements["MixedElement"]([P1_again, P1_again]) is mixed
+    assert cache_info(cached_elements).hits == hits + 3
+    # Elements not made by a factory only compare equal to themselves
+    other = Lagrange(ufc_simplex(1), 1)
+    assert cached_elements["TensorProductElement"](other, P1) is not tpe
+
+
+def test_factory_unkeyed_elements():
+    """Elements not made by a factory must not alias a freed element
+    that had the same id."""
+    from FIAT import Bubble, DiscontinuousLagrange, NodalEnrichedElement
+    cell = ufc_simplex(2)
+    factory = ElementFactory(NodalEnrichedElement)
+    bubble = Bubble(cell, 3)
+    for i in range(10):
+        arg = Lagrange(cell, 1)
+        element = factory(arg, bubble)
+        del arg
+        assert element.entity_dofs()[0] == {0: [0], 1: [1], 2: [2]}
+        arg = DiscontinuousLagrange(cell, 1)
+        element = factory(arg, bubble)
+        del arg
+        assert element.entity_dofs()[0] == {0: [], 1: [], 2: []}
+    assert factory.cache_info().hits == 0
+
+
+def test_factory_keeps_factors(monkeypatch):
+    """Shared elements with a factored nodal basis are made read-only
+    without expanding it."""
+    import FIAT.polynomial_set
+    from FIAT import BrezziDouglasMarini
+    from FIAT.finite_element import CiarletElement
+    from FIAT.polynomial_set import ONPolynomialSet
+
+    class FactoredElement(CiarletElement):
+        def __init__(self, cell):
+            super(FactoredElement, self).__init__(ONPolynomialSet(cell, 1, (2,)),
+                                                  BrezziDouglasMarini(cell, 1).dual, 1,
+                                                  nodal=True)
+
+    def expand(*args):
+        raise AssertionError("Factored set expanded")
+
+    monkeypatch.setattr(FIAT.polynomial_set, "_expand_factors", expand)
+    element = ElementFactory(FactoredElement)(ufc_simplex(2))
+    factors = element.get_nodal_basis().get_factors()
+    assert factors is not None
+    assert not any(f.flags.writeable for f in factors)
+
+
+def test_factory_maxsize():
+    factory = ElementFactory(Lagrange, maxsize=2)
+    P1 = factory(ufc_simplex(2), 1)
+    factory(ufc_simplex(2), 2)
+    factory(ufc_simplex(2), 1)
+    factory(ufc_simplex(2), 3)
+    assert factory.cache_info().currsize == 2
+    assert factory(ufc_simplex(2), 1) is P1
+    assert np.allclose(P1.tabulate(0, [(0.0, 0.0)])[(0, 0)][:, 0], [1, 0, 0])
+
+
+@pytest.mark.parametrize("args", [("Lagrange", (ufc_simplex(3), 3)),
+                                  ("Nedelec 1st kind H(curl)", (ufc_simplex(2), 2)),
+                                  ("Argyris", (ufc_simplex(2), 5))])
+def test_disk_cache(tmpdir, args):
+    """Elements stored on disk by one factory are loaded, memory mapped,
+    by another one."""
+    import FIAT
+    name, element_args = args
+    element_class = FIAT.supported_elements[name]
+    first = ElementFactory(element_class, cache_dir=str(tmpdir))
+    second = ElementFactory(element_class, cache_dir=str(tmpdir))
+    e = first(*element_args)
+    f = second(*element_args)
+    assert (first.disk_hits, second.disk_hits) == (0, 1)
+    assert f is not e
+    assert not any(path.ext == ".pickle" for path in tmpdir.visit())
+    assert isinstance(f.get_coeffs(), np.memmap)
+    assert f.entity_dofs() == e.entity_dofs()
+
+    pts = e.get_reference_element().make_points(e.get_reference_element().get_spatial_dimension(), 0, 4)
+    for alpha, vals in e.tabulate(1, pts).items():
+        assert np.allclose(f.tabulate(1, pts)[alpha], vals)
+
+
+def test_store_tensor_legendre_element(tmpdir):
+    """Elements on tensor product cells hold expansion sets with
+    lambdas, which are stored by reference to their cell."""
+    from FIAT.dual_set import DualSet
+    from FIAT.element_factory import save_element, load_element
+    from FIAT.finite_element import CiarletElement
+    from FIAT.functional import PointEvaluation
+    from FIAT.polynomial_set import ONPolynomialSet
+    from FIAT.reference_element import UFCQuadrilateral
+    cell = UFCQuadrilateral()
+    nodes = [PointEvaluation(cell, v) for v in cell.get_vertices()]
+    entity_ids = {dim: {entity: [entity] if dim == 0 else []
+                        for entity in entities}
+                  for dim, entities in cell.get_topology().items()}
+    e = CiarletElement(ONPolynomialSet(cell, 1), DualSet(nodes, cell, entity_ids), 1)
+    directory = str(tmpdir.join("element"))
+    save_element(e, directory)
+    f = load_element(directory)
+    pts = np.random.RandomState(0).rand(4, 2)
+    for alpha, vals in e.tabulate(1, pts).items():
+        assert np.allclose(f.tabulate(1, pts)[alpha], vals)
+
+
+def test_load_refuses_foreign_classes(tmpdir):
+    """Stored elements may only name FIAT classes."""
+    import json
+    from FIAT.element_factory import load_element
+    tmpdir.join("element.json").write(json.dumps(
+        {"format": 1, "element": {"kind": "object", "id": 0, "cls": "os:system",
+                                  "attributes": {}}}))
+    with pytest.raises(ValueError):
+        load_element(str(tmpdir))
+
+
+if __name__ == '__main__':
+    import os
+    pytest.main(os.path.abspath(__file__))
@@ -0,0 +1,217 @@
+# Copyright (C) 2019 Imperial College London and others
+#
+# This file is part of FIAT.
+#
+# FIAT is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# FIAT is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with FIAT. If not, see <http://www.gnu.org/licenses/>.
+
+import pytest
+import numpy as np
+
+from FIAT import expansions
+from FIAT.reference_element import (ufc_simplex, default_simplex, make_lattice,
+                                    UFCQuadrilateral, UFCHexahedron)
+
+
+@pytest.mark.parametrize("cell", [ufc_simplex(2), default_simplex(2),
+                                  ufc_simplex(3), default_simplex(3)])
+@pytest.mark.parametrize("degree", range(5))
+def test_jet_finite_differences(cell, degree):
+    """Check each order of the jet against central differences of the
+    previous one."""
+    sd = cell.get_spatial_dimension()
+    es = expansions.get_expansion_set(cell)
+    pts = np.array(make_lattice(cell.get_vertices(), 4, interior=1))
+    order = 2
+    jet = es.tabulate_jet(degree, pts, order)
+
+    assert np.allclose(jet[0], es.tabulate(degree, pts))
+
+    h = 1.e-6
+    for r in range(1, order + 1):
+        for i in range(sd):
+            e = h * np.eye(sd)[i]
+            fp = es.tabulate_jet(degree, pts + e, r - 1)[r - 1]
+            fm = es.tabulate_jet(degree, pts - e, r - 1)[r - 1]
+            assert np.allclose(jet[r][..., i], (fp - fm) / (2 * h), atol=1.e-6)
+
+
+@pytest.mark.parametrize("cell", [ufc_simplex(1), default_simplex(1)])
+@pytest.mark.parametrize("degree", range(6))
+def test_line_jet(cell, degree):
+    """Compare the line jet against differentiated Legendre series."""
+    es = expansions.get_expansion_set(cell)
+    pts = np.array(make_lattice(cell.get_vertices(), 7))
+    order = 3
+    jet = es.tabulate_jet(degree, pts, order)
+    assert jet.shape == (order + 1, degree + 1, len(pts))
+
+    A, b = es.A[0, 0], es.b[0]
+    xs = A * pts[:, 0] + b
+    for k in range(degree + 1):
+        c = np.zeros(k + 1)
+        c[k] = np.sqrt(k + 0.5)
+        for r in range(order + 1):
+            expected = A**r * np.polynomial.legendre.legval(xs, np.polynomial.legendre.legder(c, r))
+            assert np.allclose(jet[r, k], expected)
+
+
+@pytest.mark.parametrize("cell", [ufc_simplex(1), ufc_simplex(2), ufc_simplex(3)])
+@pytest.mark.parametrize("degree", [1, 4, 14])
+def test_dmats(cell, degree):
+    """The dmats must reproduce the derivatives of the expansion set."""
+    from FIAT.polynomial_set import ONPolynomialSet
+    sd = cell.get_spatial_dimension()
+    P = ONPolynomialSet(cell, degree)
+    pts = np.array(make_lattice(cell.get_vertices(), 5))
+    jet = P.get_expansion_set().tabulate_jet(degree, pts, 1)
+    dv = np.reshape(jet[1], (-1, len(pts), sd))
+    for i, dmat in enumerate(P.get_dmats()):
+        assert np.allclose(np.dot(dmat.T, jet[0]), dv[:, :, i], atol=1.e-9)
+
+
+@pytest.mark.parametrize("cell", [UFCQuadrilateral(), UFCHexahedron()])
+@pytest.mark.parametrize("degree", range(4))
+def test_tensor_legendre(cell, degree):
+    """The hypercube expansion set is the product of the line
+    expansion sets, and its jets, dmats and evaluation must agree."""
+    from FIAT.polynomial_set import ONPolynomialSet
+    sd = cell.get_spatial_dimension()
+    es = expansions.get_expansion_set(cell)
+    assert es.get_num_members(degree) == expansions.polynomial_dimension(cell, degree)
+    pts = np.random.RandomState(0).rand(6, sd)
+
+    lines = [expansions.get_expansion_set(c).tabulate(degree, pts[:, i:i + 1])
+             for i, c in enumerate(cell.product.cells)]
+    expected = lines[0]
+    for table in lines[1:]:
+        expected = np.einsum("ip,jp->ijp", expected, table).reshape(-1, len(pts))
+    assert np.allclose(es.tabulate(degree, pts), expected)
+
+    order = 2
+    jet = es.tabulate_jet(degree, pts, order)
+    assert np.allclose(jet[0], expected)
+    h = 1.e-6
+    for r in range(1, order + 1):
+        for i in range(sd):
+            e = h * np.eye(sd)[i]
+            fp = es.tabulate_jet(degree, pts + e, r - 1)[r - 1]
+            fm = es.tabulate_jet(degree, pts - e, r - 1)[r - 1]
+            assert np.allclose(jet[r][..., i], (fp - fm) / (2 * h), atol=1.e-5)
+
+    P = ONPolynomialSet(cell, degree)
+    for i, dmat in enumerate(P.get_dmats()):
+        assert np.allclose(np.dot(dmat.T, jet[0]), jet[1][..., i])
+
+    coeffs = np.random.RandomState(1).rand(2, 3, es.get_num_members(degree))
+    result = es.evaluate(degree, coeffs, pts, order=1)
+    assert np.allclose(result[(0,) * sd], np.dot(coeffs, jet[0]))
+    for i in range(sd):
+        alpha = tuple(np.eye(sd, dtype=int)[i])
+        assert np.allclose(result[alpha], np.dot(coeffs, jet[1][..., i]))
+
+
+@pytest.mark.parametrize("cell", [UFCQuadrilateral(), UFCHexahedron()])
+def test_ciarlet_element_on_hypercube(cell):
+    """A Q2 element built directly on the hypercube must match the
+    flattened tensor product element."""
+    from FIAT import Lagrange
+    from FIAT.tensor_product import TensorProductElement, FlattenedDimensions
+    from FIAT.dual_set import DualSet
+    from FIAT.finite_element import CiarletElement
+    from FIAT.functional import PointEvaluation
+    from FIAT.polynomial_set import ONPolynomialSet
+    from FIAT.reference_element import UFCInterval
+    sd = cell.get_spatial_dimension()
+    tpe = FlattenedDimensions(TensorProductElement(*[Lagrange(UFCInterval(), 2)] * sd))
+    nodes = [PointEvaluation(cell, next(iter(n.get_point_dict()))) for n in tpe.dual_basis()]
+    element = CiarletElement(ONPolynomialSet(cell, 2), DualSet(nodes, cell, tpe.entity_dofs()), 2)
+
+    pts = np.random.RandomState(0).rand(5, sd)
+    expected = tpe.tabulate(1, pts)
+    tab = element.tabulate(1, pts)
+    for alpha in expected:
+        assert np.allclose(tab[alpha], expected[alpha])
+
+
+@pytest.mark.parametrize("cell", [ufc_simplex(2), default_simplex(2),
+                                  ufc_simplex(3), default_simplex(3)])
+@pytest.mark.parametrize("degree", range(5))
+def test_contract_collapsed(cell, degree):
+    """Sum factorised contraction at the points of a collapsed
+    quadrature rule must agree with the tabulated expansion set."""
+    from FIAT.quadrature import make_quadrature
+    es = expansions.get_expansion_set(cell)
+    Q = make_quadrature(cell, 4)
+    factors = es.tabulate_collapsed(degree, Q.get_collapsed_points())
+    coeffs = np.random.RandomState(0).rand(2, 3, es.get_num_members(degree))
+    expected = np.dot(coeffs, es.tabulate(degree, Q.get_points()))
+    assert np.allclose(es.contract_collapsed(degree, coeffs, factors), expected)
+
+
+def test_on_set_data_shared():
+    """Equal cells share (read-only) expansion sets, coefficients and dmats."""
+    from FIAT.polynomial_set import ONPolynomialSet
+    P = ONPolynomialSet(ufc_simplex(2), 3, (2,))
+    Q = ONPolynomialSet(ufc_simplex(2), 3, (2,))
+    assert P.get_expansion_set() is Q.get_expansion_set()
+    assert all(a is b for a, b in zip(P.get_factors(), Q.get_factors()))
+    assert all(a is b for a, b in zip(P.get_dmats(), Q.get_dmats()))
+    with pytest.raises(ValueError):
+        P.get_coeffs()[0, 0, 0] = 2.0
+
+
+def test_on_set_data_by_vertices():
+    """Cells of the same type with different vertices compare equal but
+    must not share expansion sets or dmats."""
+    from FIAT.polynomial_set import ONPolynomialSet
+    from FIAT.reference_element import Simplex, TRIANGLE
+    ref = ufc_simplex(2)
+    big = Simplex(TRIANGLE, 2 * np.array(ref.get_vertices()), ref.get_topology())
+    small = Simplex(TRIANGLE, ref.get_vertices(), ref.get_topology())
+    assert big == small
+    P = ONPolynomialSet(big, 2)
+    Q = ONPolynomialSet(small, 2)
+    assert P.get_expansion_set() is not Q.get_expansion_set()
+    assert np.allclose(P.get_expansion_set().ref_el.get_vertices(), big.get_vertices())
+    pts = [[0.2, 0.3]]
+    assert not np.allclose(P.tabulate(pts)[(0, 0)], Q.tabulate(pts)[(0, 0)])
+    assert np.allclose(2 * P.get_dmats()[0], Q.get_dmats()[0])
+
+
+@pytest.mark.parametrize("shape", [(2,), (2, 2), "sym"])
+def test_factored_on_set(shape):
+    """Factored ON sets tabulate like their dense counterparts."""
+    from FIAT.polynomial_set import (PolynomialSet, ONPolynomialSet,
+                                     ONSymTensorPolynomialSet)
+    cell = ufc_simplex(2)
+    if shape == "sym":
+        P = ONSymTensorPolynomialSet(cell, 3)
+    else:
+        P = ONPolynomialSet(cell, 3, shape)
+    assert P.get_factors() is not None
+    dense = PolynomialSet(cell, 3, 3, P.get_expansion_set(),
+                          np.array(P.get_coeffs()), P.get_dmats())
+    items = list(range(0, P.get_num_members(), 3))
+    pts = np.array(make_lattice(cell.get_vertices(), 3))
+    for U, V in [(P, dense), (P.take(items), dense.take(items))]:
+        assert U.get_shape() == V.get_shape()
+        assert np.allclose(U.get_coeffs(), V.get_coeffs())
+        Ut, Vt = U.tabulate(pts, 2), V.tabulate(pts, 2)
+        for alpha in Vt:
+            assert np.allclose(Ut[alpha], Vt[alpha])
+
+
+if __name__ == '__main__':
+    import os
+    pytest.main(os.path.abspath(__file__))
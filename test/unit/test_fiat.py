@@ -45,6 +45,7 @@ from FIAT.hdivcurl import Hdiv, Hcurl                           # noqa: F401
 from FIAT.argyris import Argyris, QuinticArgyris                # noqa: F401
 from FIAT.hermite import CubicHermite                           # noqa: F401
 from FIAT.morley import Morley                                  # noqa: F401
+from FIAT.bell import Bell
 from FIAT.bubble import Bubble
 from FIAT.enriched import EnrichedElement                       # noqa: F401
 from FIAT.nodal_enriched import NodalEnrichedElement
@@ -284,6 +285,225 @@ def test_illposed_nodal_enriched(elements):
         NodalEnrichedElement(*elements)
 
 
+@pytest.mark.parametrize('degree', [1, 2])
+def test_argyris_low_degree(degree):
+    """Argyris needs degree 5 or more, below that the Vandermonde
+    matrix is not square."""
+    with pytest.raises(np.linalg.LinAlgError):
+        Argyris(T, degree)
+
+
+@pytest.mark.parametrize('degree', [60, 80])
+def test_ill_conditioned_vandermonde(degree):
+    """Ill-conditioned but nonsingular Vandermonde matrices are
+    reported, not rejected."""
+    element = Lagrange(I, degree)
+    assert element.vandermonde_condition_number() > 1e12
+
+
+@pytest.mark.parametrize('element', [
+    Lagrange(T, 3),
+    Lagrange(T, 12),
+    Nedelec(S, 2),
+    Regge(T, 1),
+])
+def test_vandermonde_factors(element):
+    """The stored factorisation must solve with V and its transpose."""
+    V = element.V
+    b = np.arange(2 * len(V), dtype=float).reshape(len(V), 2)
+    assert np.allclose(np.dot(V, element.solve_vandermonde(b)), b)
+    assert np.allclose(np.dot(V.T, element.solve_vandermonde(b, transpose=True)), b)
+    assert np.isclose(element.vandermonde_condition_number(), np.linalg.cond(V))
+
+
+def test_factored_poly_set_nodal_basis():
+    """Factored and dense polynomial sets must give the same nodal basis."""
+    from FIAT.finite_element import CiarletElement
+    from FIAT.polynomial_set import ONSymTensorPolynomialSet, PolynomialSet
+    P = ONSymTensorPolynomialSet(T, 2)
+    dense = PolynomialSet(T, 2, 2, P.get_expansion_set(), P.get_coeffs(), P.get_dmats())
+    dual = Regge(T, 2).dual
+    factored = CiarletElement(ONSymTensorPolynomialSet(T, 2), dual, 2)
+    assert np.allclose(factored.get_coeffs(), CiarletElement(dense, dual, 2).get_coeffs())
+
+
+def test_restricted_interior():
+    "Restriction to the interior of a vector valued element"
+    element = RestrictedElement(Nedelec(S, 3), restriction_domain="interior")
+    assert element.space_dimension() == len(Nedelec(S, 3).entity_dofs()[3][0])
+    assert element.vandermonde_condition_number() == 1.0
+
+
+@pytest.mark.parametrize('indices', [[3, 0], [5, 1, 3], [2, 0, 1]])
+def test_restricted_unsorted_indices(indices):
+    "The restricted basis must be dual to the restricted nodes in any order"
+    element = RestrictedElement(Lagrange(T, 2), indices=indices)
+    pts = [next(iter(node.get_point_dict())) for node in element.dual_basis()]
+    assert np.allclose(element.tabulate(0, pts)[(0, 0)], np.eye(len(indices)))
+
+
+@pytest.mark.parametrize('element', [
+    "Lagrange(S, 2)",
+    "Nedelec(T, 2)",
+    "Bubble(S, 4)",
+    "MixedElement([Lagrange(T, 1), RaviartThomas(T, 1)])",
+    "EnrichedElement(Lagrange(T, 1), Bubble(T, 3))",
+    "TensorProductElement(Lagrange(T, 1), DiscontinuousLagrange(I, 1))",
+    "Hdiv(TensorProductElement(Lagrange(I, 1), DiscontinuousLagrange(I, 0)))",
+    "FlattenedDimensions(TensorProductElement(Lagrange(I, 2), Lagrange(I, 1)))",
+])
+def test_tabulate_all_entities(element):
+    """Tabulating on all entities at once must agree with tabulating
+    entity by entity."""
+    element = eval(element)
+    cell = element.get_reference_element()
+    for dim in cell.get_topology():
+        sub_cell = cell.construct_subelement(dim)
+        sd = sub_cell.get_spatial_dimension()
+        points = [tuple(0.1 * (i + 1) / (sd or 1) for _ in range(sd)) for i in range(3)]
+        tables = element.tabulate_all_entities(1, points, dim)
+        for e in cell.get_topology()[dim]:
+            expected = element.tabulate(1, points, (dim, e))
+            assert set(tables) == set(expected)
+            for alpha in expected:
+                assert np.allclose(tables[alpha][e], expected[alpha])
+
+
+@pytest.mark.parametrize('element', [
+    "Lagrange(S, 2)",
+    "Regge(T, 1)",
+    "TensorProductElement(Lagrange(T, 1), DiscontinuousLagrange(I, 1))",
+])
+def test_tabulate_array(element):
+    """The array layout must hold the dict entries in the order of the
+    multi-index table, and can be written to a given buffer."""
+    from FIAT.polynomial_set import derivative_multi_indices
+    element = eval(element)
+    sd = element.get_reference_element().get_spatial_dimension()
+    points = [tuple(0.1 * (i + 1) for _ in range(sd)) for i in range(4)]
+    table = element.tabulate(2, points)
+    alphas = derivative_multi_indices(sd, 2)
+    assert set(alphas) == set(table)
+
+    out = np.empty((len(alphas),) + table[alphas[0]].shape)
+    assert element.tabulate_array(2, points, out=out) is out
+    for k, alpha in enumerate(alphas):
+        assert np.allclose(out[k], table[alpha])
+    with pytest.raises(ValueError):
+        element.tabulate_array(1, points, out=out)
+
+
+@pytest.mark.parametrize('element', [
+    "Lagrange(S, 3)",
+    "Nedelec(T, 2)",
+    "Bernstein(T, 3)",
+    "TensorProductElement(Lagrange(T, 2), DiscontinuousLagrange(I, 1))",
+    "Hcurl(TensorProductElement(Lagrange(I, 1), DiscontinuousLagrange(I, 0)))",
+])
+def test_tabulate_selected_derivatives(element):
+    """Tabulating selected multi-indices, eagerly or lazily, must agree
+    with the full tabulation."""
+    from FIAT.bernstein import Bernstein  # noqa: F401
+    element = eval(element)
+    sd = element.get_reference_element().get_spatial_dimension()
+    points = [tuple(0.1 * (i + 1) for _ in range(sd)) for i in range(3)]
+    full = element.tabulate(2, points)
+    alphas = [(2,) + (0,) * (sd - 1), (0,) * (sd - 1) + (1,)]
+
+    table = element.tabulate(alphas, points)
+    assert sorted(table) == sorted(alphas)
+    lazy = element.tabulate_lazy(2, points)
+    assert set(lazy) == set(full)
+    for alpha in alphas:
+        assert np.allclose(table[alpha], full[alpha])
+        assert np.allclose(lazy[alpha], full[alpha])
+
+
+def test_tabulate_lazy():
+    "Only the derivatives looked up are tabulated"
+    lazy = Lagrange(S, 2).tabulate_lazy(2, [(0.1, 0.2, 0.3)])
+    assert (1, 1, 0) in lazy and (3, 0, 0) not in lazy
+    assert lazy[(1, 1, 0)].shape == (10, 1)
+
+
+def test_lazy_tabulation_calls():
+    "Tables are computed when first looked up, and only once"
+    from FIAT.polynomial_set import LazyTabulation
+    calls = []
+
+    def tabulate(alpha):
+        calls.append(alpha)
+        return np.full((2, 1), sum(alpha))
+
+    lazy = LazyTabulation([(0, 0), (1, 0), (0, 1)], tabulate)
+    assert len(lazy) == 3 and calls == []
+    assert lazy[(1, 0)][0, 0] == 1
+    assert lazy[[1, 0]] is lazy[(1, 0)]
+    assert calls == [(1, 0)]
+    with pytest.raises(KeyError):
+        lazy[(2, 0)]
+    assert calls == [(1, 0)]
+
+
+@pytest.mark.parametrize('element', [
+    "Lagrange(I, 4)",
+    "Lagrange(T, 3)",
+    "Nedelec(S, 2)",
+    "Regge(T, 1)",
+])
+@pytest.mark.parametrize('shared_points', [False, True])
+def test_evaluate(element, shared_points):
+    """Evaluating functions from their modal coefficients must agree
+    with contracting the tabulated basis."""
+    element = eval(element)
+    sd = element.get_reference_element().get_spatial_dimension()
+    rng = np.random.RandomState(0)
+    dofs = rng.rand(3, element.space_dimension())
+    points = rng.rand(3, 4, sd) / sd
+    if shared_points:
+        points = points[0]
+    result = element.evaluate(dofs, points, order=2)
+    for c in range(len(dofs)):
+        table = element.tabulate(2, points if shared_points else points[c])
+        assert set(result) == set(table)
+        for alpha, vals in table.items():
+            assert np.allclose(result[alpha][c], np.tensordot(dofs[c], vals, 1))
+
+
+@pytest.mark.parametrize('element', [
+    "Lagrange(T, 3)",
+    "Nedelec(S, 2)",
+    "Regge(T, 1)",
+])
+def test_tabulate_collapsed_rule(element):
+    """Tabulating at a collapsed quadrature rule must agree with
+    tabulating at its points."""
+    from FIAT.quadrature import make_quadrature
+    element = eval(element)
+    Q = make_quadrature(element.get_reference_element(), 4)
+    points = Q.get_points()
+    expected = element.tabulate(2, points)
+    tab = element.tabulate(2, Q)
+    lazy = element.tabulate_lazy(2, Q)
+    array = element.tabulate_array(2, Q)
+    for k, alpha in enumerate(expected):
+        assert np.allclose(tab[alpha], expected[alpha])
+        assert np.allclose(lazy[alpha], expected[alpha])
+        assert np.allclose(array[k], expected[alpha])
+
+
+def test_bell():
+    """Bell must build, and its vertex values and gradients must be
+    dual to the vertex nodes."""
+    element = Bell(T)
+    tab = element.tabulate(1, T.get_vertices())
+    for v in range(3):
+        for alpha, node in [((0, 0), 0), ((1, 0), 1), ((0, 1), 2)]:
+            expected = np.zeros(element.space_dimension())
+            expected[6 * v + node] = 1.0
+            assert np.allclose(tab[alpha][:, v], expected)
+
+
 def test_empty_bubble():
     "Check that bubble of too low degree fails"
     with pytest.raises(RuntimeError):
@@ -0,0 +1,134 @@
+# Copyright (C) 2019 Imperial College London and others
+#
+# This file is part of FIAT.
+#
+# FIAT is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# FIAT is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with FIAT. If not, see <http://www.gnu.org/licenses/>.
+
+import pytest
+import numpy as np
+
+from FIAT import functional
+from FIAT.polynomial_set import ONPolynomialSet
+from FIAT.quadrature import make_quadrature
+from FIAT.reference_element import ufc_simplex
+
+
+@pytest.mark.parametrize("sd", [1, 2, 3])
+@pytest.mark.parametrize("alpha_order", [1, 2, 3])
+def test_point_derivative_to_riesz(sd, alpha_order):
+    """The Riesz representation of a point derivative must reproduce the
+    derivatives tabulated by the polynomial set."""
+    cell = ufc_simplex(sd)
+    P = ONPolynomialSet(cell, 4)
+    x = tuple([0.2] * sd)
+    for alpha in P.tabulate([x], alpha_order):
+        if sum(alpha) != alpha_order:
+            continue
+        ell = functional.PointDerivative(cell, x, alpha)
+        riesz = ell.to_riesz(P)
+        expected = P.tabulate([x], alpha_order)[alpha][:, 0]
+        assert np.allclose(np.dot(P.get_coeffs(), riesz), expected)
+
+
+def test_normal_derivative_moment():
+    """The moment of the normal derivative must weight by f, both in its
+    Riesz representation and in its derivative dictionary."""
+    cell = ufc_simplex(2)
+    P = ONPolynomialSet(cell, 3)
+    facet = cell.construct_subelement(1)
+    Q = make_quadrature(facet, 4)
+    f_at_qpts = np.array([x[0] for x in Q.get_points()])
+    ell = functional.IntegralMomentOfNormalDerivative(cell, 0, Q, f_at_qpts)
+
+    n = cell.compute_normal(0)
+    pts = np.array(list(ell.deriv_dict.keys()))
+    jet = P.tabulate(pts, 1)
+    dn = sum(n[i] * jet[alpha] for i, alpha in enumerate([(1, 0), (0, 1)]))
+    expected = np.dot(dn, Q.get_weights() * f_at_qpts)
+
+    assert np.allclose(np.dot(P.get_coeffs(), ell.to_riesz(P)), expected)
+    weights = [sum(w * n[i] for i, (w, a, c) in enumerate(wac))
+               for wac in ell.deriv_dict.values()]
+    assert np.allclose(weights, Q.get_weights() * f_at_qpts)
+
+
+def test_functional_arrays_roundtrip():
+    """Point and derivative dictionaries are stored as arrays and can be
+    recovered from them."""
+    cell = ufc_simplex(2)
+    pt_dict = {(0.0, 0.5): [(1.0, (0,)), (2.0, 1)],
+               (0.25, 0.25): [(-1.0, (1,))]}
+    deriv_dict = {(0.5, 0.5): [(3.0, (1, 0), (0,)), (4.0, [0, 2], (1,))]}
+    ell = functional.Functional(cell, (2,), pt_dict, deriv_dict, "Test")
+
+    arrays = ell.get_point_arrays()
+    assert arrays.points.shape == (2, 2)
+    assert np.allclose(arrays.weights, [1.0, 2.0, -1.0])
+    assert ell.max_deriv_order == 2
+    assert ell.get_point_dict() == {(0.0, 0.5): [(1.0, (0,)), (2.0, (1,))],
+                                    (0.25, 0.25): [(-1.0, (1,))]}
+    assert ell.deriv_dict == {(0.5, 0.5): [(3.0, (1, 0), (0,)),
+                                           (4.0, (0, 2), (1,))]}
+
+
+@pytest.mark.parametrize("element", ["Lagrange(ufc_simplex(3), 4)",
+                                     "Nedelec(ufc_simplex(3), 2)",
+                                     "Regge(ufc_simplex(2), 1)",
+                                     "CubicHermite(ufc_simplex(2))"])
+def test_dual_set_to_riesz(element):
+    """Applying the Riesz representation of a dual set to a polynomial
+    set must agree with evaluating each node on its members."""
+    from FIAT import Lagrange, Nedelec, Regge, CubicHermite  # noqa: F401
+    e = eval(element)
+    P = e.get_nodal_basis()
+    sd = e.get_reference_element().get_spatial_dimension()
+    mat = e.dual.to_riesz(P)
+    num_axes = P.get_coeffs().ndim - 1
+    for node, row in zip(e.dual_basis(), mat):
+        expected = 0
+        for pt, wc_list in node.get_point_dict().items():
+            vals = P.tabulate([pt])[(0,) * sd]
+            for (w, c) in wc_list:
+                expected = expected + w * vals[(slice(None),) + c + (0,)]
+        for pt, wac_list in node.deriv_dict.items():
+            vals = P.tabulate([pt], node.max_deriv_order)
+            for (w, alpha, c) in wac_list:
+                expected = expected + w * vals[tuple(alpha)][(slice(None),) + c + (0,)]
+        assert np.allclose(np.tensordot(P.get_coeffs(), row, num_axes), expected)
+
+
+@pytest.mark.parametrize("element", ["Lagrange(ufc_simplex(3), 3)",
+                                     "Nedelec(ufc_simplex(2), 2)",
+                                     "Regge(ufc_simplex(2), 1)",
+                                     "CubicHermite(ufc_simplex(2))"])
+def test_interpolation_matrix(element):
+    """Interpolating the members of an element through the dual set's
+    interpolation matrix must give the identity."""
+    from FIAT import Lagrange, Nedelec, Regge, CubicHermite  # noqa: F401
+    e = eval(element)
+    pts = e.dual.get_interpolation_points()
+    alphas = e.dual.get_interpolation_alphas()
+    M = e.dual.get_interpolation_matrix()
+    assert M.shape == (e.space_dimension(), len(alphas), len(pts)) + e.value_shape()
+
+    order = int(max(np.sum(alphas, axis=1)))
+    tab = e.tabulate(order, pts)
+    # F[a, p, ..., i] is the derivative alphas[a] of the i:th member
+    F = np.array([np.moveaxis(tab[tuple(alpha)], [0, -1], [-1, 0]) for alpha in alphas])
+    assert np.allclose(np.tensordot(M, F, M.ndim - 1), np.eye(e.space_dimension()))
+
+
+if __name__ == '__main__':
+    import os
+    pytest.main(os.path.abspath(__file__))
@@ -0,0 +1,77 @@
+# Copyright (C) 2019 Imperial College London and others
+#
+# This file is part of FIAT.
+#
+# FIAT is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# FIAT is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with FIAT. If not, see <http://www.gnu.org/licenses/>.
+
+import pytest
+import numpy as np
+
+from FIAT import (Lagrange, RaviartThomas, Nedelec, Regge,
+                  HellanHerrmannJohnson)
+from FIAT.push_forward import physical_tabulate, push_forward
+from FIAT.reference_element import ufc_simplex
+
+
+def pushed_forward(mapping, v, J):
+    "The push forward of one value on one cell."
+    detJ = np.linalg.det(J)
+    K = np.linalg.inv(J)
+    return {"affine": lambda: v,
+            "contravariant piola": lambda: np.dot(J, v) / detJ,
+            "covariant piola": lambda: np.dot(K.T, v),
+            "double contravariant piola": lambda: np.dot(J, np.dot(v, J.T)) / detJ**2,
+            "double covariant piola": lambda: np.dot(K.T, np.dot(v, K))}[mapping]()
+
+
+@pytest.mark.parametrize("element", [Lagrange(ufc_simplex(2), 2),
+                                     RaviartThomas(ufc_simplex(2), 2),
+                                     Nedelec(ufc_simplex(3), 1),
+                                     Regge(ufc_simplex(2), 1),
+                                     HellanHerrmannJohnson(ufc_simplex(2), 1)])
+def test_physical_tabulate(element):
+    """Batched values must match the push forward cell by cell, and
+    gradients must match finite differences of the physical values."""
+    sd = element.get_reference_element().get_spatial_dimension()
+    mapping = element.mapping()[0]
+    J = np.random.RandomState(0).rand(4, sd, sd) + 2 * np.eye(sd)
+    points = np.array([[0.1 * (i + 1)] * sd for i in range(3)])
+
+    values, grads = physical_tabulate(element, element.tabulate_array(1, points), J)
+    ref = element.tabulate_array(0, points)[0]
+    for c in range(len(J)):
+        for i in range(element.space_dimension()):
+            for p in range(len(points)):
+                expected = pushed_forward(mapping, ref[i, ..., p], J[c])
+                assert np.allclose(values[c, i, ..., p], expected)
+
+    # d/dX_m of the physical values is sum_k J[k, m] d/dx_k
+    h = 1.e-6
+    for m in range(sd):
+        e = h * np.eye(sd)[m]
+        fp = physical_tabulate(element, element.tabulate_array(0, points + e), J)[0]
+        fm = physical_tabulate(element, element.tabulate_array(0, points - e), J)[0]
+        expected = (fp - fm) / (2 * h)
+        assert np.allclose(np.einsum("ck,c...kp->c...p", J[:, :, m], grads), expected, atol=1.e-6)
+
+
+def test_manifold_push_forward():
+    "Contravariant Piola on a surface preserves the normal flux."
+    element = RaviartThomas(ufc_simplex(2), 1)
+    J = np.array([[[1.0, 0.0], [0.0, 1.0], [0.0, 0.0]]])
+    values = element.tabulate_array(0, [(0.2, 0.3)])[0]
+    mapped = push_forward("contravariant piola", values, J)
+    assert mapped.shape == (1, 3, 3, 1)
+    assert np.allclose(mapped[0, :, :2], values)
+    assert np.allclose(mapped[0, :, 2], 0.0)
@@ -160,6 +160,23 @@ def test_tensor_product_composition(interval, triangle, extr_triangle, scheme):
     assert len(q.get_points()) == len(qa.get_points())*len(qb.get_points())
 
 
+def test_tensor_product_rule(interval, triangle, scheme):
+    """The lazily built points and weights of a tensor product rule
+    must be the concatenated points and products of the weights."""
+    from itertools import chain, product
+    qa = FIAT.create_quadrature(triangle, 3, scheme)
+    qb = FIAT.create_quadrature(interval, 2, scheme)
+    qc = FIAT.create_quadrature(interval, 4, scheme)
+    q = FIAT.quadrature.TensorProductQuadratureRule(qa, qb, qc)
+    assert q.get_factors() == (qa, qb, qc)
+
+    pts = [list(chain(*x)) for x in product(qa.pts, qb.pts, qc.pts)]
+    wts = [numpy.prod(w) for w in product(qa.wts, qb.wts, qc.wts)]
+    assert numpy.allclose(q.get_points(), pts)
+    assert numpy.allclose(q.get_weights(), wts)
+    assert numpy.isclose(q.integrate(lambda x: x[0] * x[2]**2), 1./18)
+
+
 @pytest.mark.parametrize(("points, degree"), tuple((p, d)
                                                    for p in range(2, 10)
                                                    for d in range(2*p - 2)))
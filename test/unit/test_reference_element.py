@@ -150,6 +150,26 @@ def test_reference_normal_vert(cell, normals):
                            cell.compute_reference_normal(vert_dim, facet_number))
 
 
+@pytest.mark.parametrize('cell',
+                         [interval, triangle, tetrahedron, quadrilateral, hexahedron,
+                          triangle_x_interval])
+def test_entity_transform(cell):
+    """Entity transforms map arrays of points like single points, with
+    affine maps that are computed once per cell."""
+    for dim, entities in cell.get_topology().items():
+        entity_dim = sum(dim) if isinstance(dim, tuple) else dim
+        pts = np.random.rand(5, entity_dim)
+        for entity, verts in entities.items():
+            transform = cell.get_entity_transform(dim, entity)
+            mapped = transform(pts)
+            assert mapped.shape == (5, cell.get_spatial_dimension())
+            for x, y in zip(pts, mapped):
+                assert np.allclose(transform(x), y)
+            assert cell.get_entity_affine_map(dim, entity) is cell.get_entity_affine_map(dim, entity)
+            if entity_dim == 0:
+                assert np.allclose(transform(()), cell.get_vertices()[verts[0]])
+
+
 if __name__ == '__main__':
     import os
     pytest.main(os.path.abspath(__file__))
@@ -560,6 +560,103 @@ def test_flattened_against_tpe_hex():
         assert np.isclose(tpe_tab[dd][7][0], flattened_tab[dd][7][0])
 
 
+def test_nary_against_nested_hex():
+    """A flat product of three elements must match the nested product
+    on every entity of the hexahedron."""
+    T = UFCInterval()
+    P2 = Lagrange(T, 2)
+    nested = FlattenedDimensions(TensorProductElement(FlattenedDimensions(TensorProductElement(P2, P2)), P2))
+    flat = FlattenedDimensions(TensorProductElement(P2, P2, P2))
+    assert flat.entity_dofs() == nested.entity_dofs()
+    assert ([n.get_point_dict() for n in flat.dual_basis()] ==
+            [n.get_point_dict() for n in nested.dual_basis()])
+
+    for dim, entities in flat.get_reference_element().get_topology().items():
+        points = np.random.RandomState(dim).rand(3, dim)
+        all_tab = flat.tabulate_all_entities(1, points, dim)
+        for entity in entities:
+            flat_tab = flat.tabulate(1, points, (dim, entity))
+            nested_tab = nested.tabulate(1, points, (dim, entity))
+            for alpha in nested_tab:
+                assert np.allclose(flat_tab[alpha], nested_tab[alpha])
+                assert np.allclose(all_tab[alpha][entity], nested_tab[alpha])
+
+
+def test_nary_outer_product_value_shape():
+    """Products of vector valued factors are tensor valued."""
+    from FIAT.finite_element import CiarletElement
+    from FIAT.polynomial_set import ONPolynomialSet
+    from FIAT.dual_set import DualSet
+    from FIAT.functional import ComponentPointEvaluation
+    T = UFCInterval()
+    nodes = [ComponentPointEvaluation(T, c, (2,), (x,)) for x in (0., 1.) for c in range(2)]
+    V = CiarletElement(ONPolynomialSet(T, 1, (2,)),
+                       DualSet(nodes, T, {0: {0: [0, 1], 1: [2, 3]}, 1: {0: []}}), 1)
+    P1 = Lagrange(UFCTriangle(), 1)
+    elt = TensorProductElement(V, P1, V)
+    assert elt.value_shape() == (2, 2)
+    assert elt.space_dimension() == 48
+
+    points = np.random.RandomState(0).rand(5, 4)
+    tab = elt.tabulate(1, points)
+    Vtab = V.tabulate(1, points[:, :1])
+    Ptab = P1.tabulate(1, points[:, 1:3])
+    Wtab = V.tabulate(1, points[:, 3:])
+    expected = np.einsum("iap,jp,kbp->ijkabp", Vtab[(1,)], Ptab[(0, 0)], Wtab[(0,)])
+    assert np.allclose(tab[(1, 0, 0, 0)], expected.reshape(48, 2, 2, 5))
+
+
+@pytest.mark.parametrize("flatten", [False, True])
+def test_tabulate_factored(flatten):
+    """Factored tables on tensor product point sets must expand to the
+    tabulation at the product points, and apply by sum factorisation."""
+    from itertools import product
+    from FIAT.tensor_product import KroneckerTable
+    I = UFCInterval()  # noqa: E741
+    quad = TensorProductElement(Lagrange(I, 3), DiscontinuousLagrange(I, 2))
+    elt = TensorProductElement(FlattenedDimensions(quad) if flatten else quad, Lagrange(I, 2))
+    if flatten:
+        elt = FlattenedDimensions(elt)
+    px, py, pz = [np.random.RandomState(i).rand(n, 1) for i, n in enumerate([4, 3, 5])]
+    points = [a + b + c for a, b, c in product(*[list(map(tuple, p)) for p in (px, py, pz)])]
+
+    factored = elt.tabulate_factored(1, ((px, py), pz))
+    full = elt.tabulate(1, points)
+    assert set(factored) == set(full)
+    for alpha, table in factored.items():
+        assert isinstance(table, KroneckerTable)
+        assert table.shape == full[alpha].shape
+        assert np.allclose(table.expand(), full[alpha])
+
+        coeffs = np.random.rand(2, table.shape[0])
+        assert np.allclose(table.apply(coeffs), np.dot(coeffs, full[alpha]))
+        values = np.random.rand(table.shape[1])
+        assert np.allclose(table.transpose_apply(values), np.dot(full[alpha], values))
+
+    # The factor rules of a tensor product quadrature rule are matched
+    # to the factors of the element
+    from FIAT.quadrature import TensorProductQuadratureRule, GaussLegendreQuadratureLineRule
+    rules = [GaussLegendreQuadratureLineRule(I, n) for n in (4, 3, 5)]
+    for rule in [TensorProductQuadratureRule(*rules),
+                 TensorProductQuadratureRule(TensorProductQuadratureRule(*rules[:2]), rules[2])]:
+        factored = elt.tabulate_factored(1, rule)
+        full = elt.tabulate(1, rule.get_points())
+        for alpha, table in factored.items():
+            assert np.allclose(table.expand(), full[alpha])
+
+    # A flat product of three factors
+    elt = TensorProductElement(Lagrange(I, 3), DiscontinuousLagrange(I, 2), Lagrange(I, 2))
+    if flatten:
+        elt = FlattenedDimensions(elt)
+    factored = elt.tabulate_factored(1, TensorProductQuadratureRule(*rules))
+    full = elt.tabulate(1, TensorProductQuadratureRule(*rules).get_points())
+    for alpha, table in factored.items():
+        assert len(table.factors) == 3
+        assert np.allclose(table.expand(), full[alpha])
+        coeffs = np.random.rand(table.shape[0])
+        assert np.allclose(table.apply(coeffs), np.dot(coeffs, full[alpha]))
+
+
 if __name__ == '__main__':
     import os
     pytest.main(os.path.abspath(__file__))